@@ -1,139 +1,340 @@
 import os
-import google.generativeai as genai
-import PIL.Image
+import asyncio
+import threading
 import json
+import textwrap
 from dotenv import load_dotenv
+import food_images
+import analysis_cache
+import image_preprocess
+import rate_limiter
+import tracing
+from recipe_stream import RecipeStreamParser
 
 load_dotenv()
 
 API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-flash-latest")
 
-genai.configure(api_key=API_KEY)
-model = genai.GenerativeModel('gemini-flash-latest')
+# Built on first use so importing this module needs neither the SDK (slow to
+# import) nor a key; tests and benchmarks may assign their own model here
+model = None
+_model_lock = threading.Lock()
 
-def analyze_fridge_image(image_paths: list[str], user_prompt: str = ""):
-    imgs = []
-    try:
-        for path in image_paths:
-            img = PIL.Image.open(path)
-            # Convert to RGB to ensure validation and supported format for Gemini
-            img = img.convert('RGB')
-            imgs.append(img)
-    except Exception as e:
-        return {"error": f"Failed to open image: {str(e)}"}
+def get_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=API_KEY)
+                model = genai.GenerativeModel(GEMINI_MODEL)
+    return model
 
-    prompt = f"""
-    당신은 전문 AI 셰프입니다. 이 이미지들에 있는 재료들을 분석해주세요.
-    사용자의 추가 정보: {user_prompt}
-    
+# Shared by build_prompt and build_batch_prompt, already indented like the text around them
+_RECIPE_TASK = """
     1. 이미지들에서 식별된 재료들을 종합하여 나열해주세요.
     2. 그 재료들로 만들 수 있는 맛있는 요리를 추천해주세요. 사용자가 '3개', '2개' 등 구체적인 개수를 명시했다면 반드시 그 개수에 맞춰 추천하고, 명시하지 않았다면 기본적으로 3가지를 추천해주세요.
     3. 만약 사용자가 '한식', '양식' 등 특정 스타일을 요청했다면 그에 맞춰 추천해주세요.
-    
+
     각 요리에 대해 다음 정보를 제공해주세요:
     - 요리 이름 (name)
     - 요리 이름의 영어 표기 (이미지 생성용) (english_name)
     - 재료 목록: 냉장고 재료와 기본 양념 등을 포함하며, 모든 재료(특히 소금, 설탕, 후추 등의 양념)에 대해 구체적인 계량 정보(예: 1티스푼, 10g, 1큰술 등)를 반드시 명시해주세요. (ingredients)
-    - 상세 조리 순서 (1. 2. 3. 순서로 번호를 매겨서 체계적으로 작성) (instructions)
-    
-    결과는 반드시 다음 구조의 유효한 JSON 형식이어야 합니다:
-    {{
-      "detected_ingredients": ["식별된 재료1", "식별된 재료2", ...],
+    - 상세 조리 순서 (1. 2. 3. 순서로 번호를 매겨서 체계적으로 작성) (instructions)"""
+
+# Fields of one analysis result; the batch prompt nests them one level deeper
+_RESULT_FIELDS = """      "detected_ingredients": ["식별된 재료1", "식별된 재료2", ...],
       "recipes": [
-        {{
+        {
           "name": "요리 이름",
           "english_name": "Recipe Name in English",
           "ingredients": ["재료1", "재료2"],
           "instructions": "1. 첫 번째 단계...\\n2. 두 번째 단계..."
+        },
+        ...
+      ]"""
+
+_OUTPUT_RULES = """
+    markdown 포맷(```json 등)은 사용하지 말고 순수 JSON 문자열만 출력해주세요.
+    모든 내용은 **한국어**로 작성하되, english_name 필드만 영문으로 작성해주세요."""
+
+def build_prompt(user_prompt: str = "") -> str:
+    return f"""
+    당신은 전문 AI 셰프입니다. 이 이미지들에 있는 재료들을 분석해주세요.
+    사용자의 추가 정보: {user_prompt}
+{_RECIPE_TASK}
+
+    결과는 반드시 다음 구조의 유효한 JSON 형식이어야 합니다:
+    {{
+{_RESULT_FIELDS}
+    }}
+{_OUTPUT_RULES}
+    """
+
+def build_batch_prompt(requests: list[tuple[list[int], str]]) -> str:
+    """Prompt for several independent requests answered in one call; each is (image numbers, user prompt)."""
+    lines = "\n".join(
+        f"    - 요청 {i + 1}: 이미지 {', '.join(map(str, numbers))}번 / 사용자의 추가 정보: {user_prompt}"
+        for i, (numbers, user_prompt) in enumerate(requests)
+    )
+    fields = textwrap.indent(_RESULT_FIELDS, "    ")
+    return f"""
+    당신은 전문 AI 셰프입니다. 아래에 서로 독립적인 요청 {len(requests)}개가 있습니다.
+    첨부된 이미지들은 "이미지 N:" 표시 뒤에 1번부터 순서대로 붙어 있습니다.
+{lines}
+
+    각 요청마다 그 요청에 지정된 이미지들에 있는 재료만 분석하고, 다른 요청의 이미지나 결과는 섞지 마세요.{_RECIPE_TASK}
+
+    결과는 반드시 다음 구조의 유효한 JSON 형식이어야 하며, results에는 모든 요청이 요청 번호(request)와 함께 들어 있어야 합니다:
+    {{
+      "results": [
+        {{
+          "request": 1,
+{fields}
         }},
         ...
       ]
     }}
-    
-    markdown 포맷(```json 등)은 사용하지 말고 순수 JSON 문자열만 출력해주세요.
-    모든 내용은 **한국어**로 작성하되, english_name 필드만 영문으로 작성해주세요.
+{_OUTPUT_RULES}
+    """
+
+DETECT_PROMPT = """
+    이 이미지들에 있는 식재료만 식별해서 나열해주세요. 요리 추천은 필요 없습니다.
+    결과는 반드시 {"detected_ingredients": ["재료1", "재료2", ...]} 형식의 순수 JSON으로, 재료 이름은 한국어로 작성해주세요.
     """
+
+# The ingredient list is short; capping output keeps the detection call cheap
+DETECT_MAX_OUTPUT_TOKENS = int(os.getenv("DETECT_MAX_OUTPUT_TOKENS", 512))
+
+def parse_response_text(text: str):
+    text = text.strip()
+    # Handle cases where model might still wrap in markdown despite mime_type
+    if text.startswith("```json"):
+        text = text.replace("```json", "", 1)
+    if text.endswith("```"):
+        text = text.replace("```", "", 1)
+    return json.loads(text.strip())
+
+async def generate_json(parts: list, generation_config: dict = None):
+    """One Gemini call through the shared limiter, retried on rate limits."""
+    limiter = rate_limiter.gemini
+    max_retries = limiter.max_retries
+    # Enforce JSON output using generation_config
+    config = {"response_mime_type": "application/json", **(generation_config or {})}
+
+    for attempt in range(max_retries):
+        try:
+            async with limiter.slot():
+                with tracing.span("gemini"):
+                    response = await get_model().generate_content_async(parts, generation_config=config)
+            limiter.record_success()
+            return response
+        except rate_limiter.LimiterBusy:
+            raise
+        except Exception as e:
+            if attempt < max_retries - 1 and rate_limiter.is_rate_limit_error(e):
+                retry_delay = limiter.record_rate_limited(e, attempt)
+                print(f"[AI Chef] Rate limit hit. Retrying in {retry_delay:.1f} seconds... (Attempt {attempt + 1}/{max_retries})")
+                await asyncio.sleep(retry_delay)
+            else:
+                limiter.record_failure()
+                raise e # Re-raise if not a rate limit issue or max retries reached
+
+async def detect_ingredients_async(image_paths: list[str]) -> list[str]:
+    """Only list the ingredients in the photos; much cheaper than a full analysis."""
+    imgs = await image_preprocess.prepare_images_async(image_paths)
+    cache_key = analysis_cache.make_key(imgs, DETECT_PROMPT)
+    cached = analysis_cache.cache.get(cache_key)
+    if cached is not None:
+        return cached["detected_ingredients"]
+
+    response = await generate_json(
+        [DETECT_PROMPT, *[img.as_part() for img in imgs]],
+        {"max_output_tokens": DETECT_MAX_OUTPUT_TOKENS},
+    )
+    with tracing.span("parse"):
+        data = parse_response_text(response.text)
+    detected = [str(item) for item in (data.get("detected_ingredients") or [])] if isinstance(data, dict) else []
+    analysis_cache.cache.set(cache_key, {"detected_ingredients": detected})
+    return detected
+
+async def analyze_fridge_image_async(image_paths: list[str], user_prompt: str = ""):
+    try:
+        imgs = await image_preprocess.prepare_images_async(image_paths)
+    except Exception as e:
+        return {"error": f"Failed to open image: {str(e)}"}
+    sent_bytes = sum(len(img.data) for img in imgs)
+    original_bytes = sum(img.original_size for img in imgs)
+    print(f"[AI Chef] Prepared {len(imgs)} images: {original_bytes} -> {sent_bytes} bytes")
+    return await analyze_prepared_async(imgs, user_prompt)
+
+async def analyze_prepared_async(imgs: list, user_prompt: str = ""):
+    """analyze_fridge_image_async for images that are already preprocessed."""
+    cache_key = analysis_cache.make_key(imgs, user_prompt)
+    cached = analysis_cache.cache.get(cache_key)
+    if cached is not None:
+        print(f"[AI Chef] Cache hit for analysis {cache_key[:12]}")
+        return food_images.refresh_recipe_images(cached)
+
+    prompt = build_prompt(user_prompt)
     
     try:
-        import time
-        
-        max_retries = 3
-        retry_delay = 2 # seconds
-        data = None
-        
-        for attempt in range(max_retries):
-            try:
-                # Enforce JSON output using generation_config
-                response = model.generate_content(
-                    [prompt, *imgs],
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                text = response.text.strip()
-                # Handle cases where model might still wrap in markdown despite mime_type
-                if text.startswith("```json"):
-                    text = text.replace("```json", "", 1)
-                if text.endswith("```"):
-                    text = text.replace("```", "", 1)
-                text = text.strip()
-                
-                data = json.loads(text)
-                break # Success, exit loop
-            except Exception as e:
-                error_str = str(e).lower()
-                if attempt < max_retries - 1 and ("429" in error_str or "quota" in error_str or "limit" in error_str):
-                    print(f"[AI Chef] Rate limit hit. Retrying in {retry_delay} seconds... (Attempt {attempt + 1}/{max_retries})")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2 # Exponential backoff
-                else:
-                    raise e # Re-raise if not a rate limit issue or max retries reached
+        response = await generate_json([prompt, *[img.as_part() for img in imgs]])
+        with tracing.span("parse"):
+            data = parse_response_text(response.text)
         
         if not data:
             return {"error": "Failed to generate recipes after retries."}
 
-        # Download images for each recipe
-        import requests
-        import uuid
-        
-        # Ensure directory exists
-        save_dir = os.path.join(os.path.dirname(__file__), "uploads", "foodImgs")
-        os.makedirs(save_dir, exist_ok=True)
-        
         if "recipes" in data:
             print(f"[AI Chef] Generated {len(data['recipes'])} recipes. Starting image downloads...")
-            import urllib.parse
-            for recipe in data["recipes"]:
-                query = recipe.get("english_name", recipe["name"])
-                # Encode the ENTIRE prompt segment to handle spaces and special chars correctly
-                full_prompt = f"{query} delicious food photorealistic"
-                encoded_prompt = urllib.parse.quote(full_prompt)
-                
-                # Use Bing Image Search (Thumbnail) for instant results
-                # "c=7" scales the image, "w" and "h" set dimensions.
-                image_url = f"https://tse2.mm.bing.net/th?q={encoded_prompt}&w=800&h=500&c=7&rs=1&p=0"
-                print(f"[AI Chef] Downloading image for {query}: {image_url}")
-                
-                try:
-                    # Short timeout (5s) is usually enough for these static assets
-                    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-                    img_resp = requests.get(image_url, headers=headers, timeout=5)
-                    if img_resp.status_code == 200:
-                        filename = f"{uuid.uuid4()}.jpg"
-                        file_path = os.path.join(save_dir, filename)
-                        with open(file_path, "wb") as f:
-                            f.write(img_resp.content)
-                        # Store relative path for frontend
-                        recipe["image_path"] = f"uploads/foodImgs/{filename}"
-                        print(f"[AI Chef] Saved image to {file_path}")
-                    else:
-                        print(f"[AI Chef] Failed to download image. Status code: {img_resp.status_code}")
-                except Exception as e:
-                    print(f"[AI Chef] Failed to download image from {image_url}: {e}")
+            if food_images.IMAGE_FETCH_MODE == "background":
+                food_images.schedule_recipe_images(data["recipes"])
+            else:
+                # Downloads run on the pooled fetch threads; only the wait is moved off the loop
+                with tracing.span("recipe_images"):
+                    await asyncio.to_thread(food_images.fetch_recipe_images, data["recipes"])
         else:
              print(f"[AI Chef] No recipes found in response data: {data.keys()}")
                     
+        analysis_cache.cache.set(cache_key, data)
         return data
+    except rate_limiter.LimiterBusy:
+        # Surface as 429 to the client rather than as a generation failure
+        raise
     except Exception as e:
         print(f"Error in AI Agent: {e}")
         raw_text = response.text if 'response' in locals() else "No response"
         print(f"Raw Text: {raw_text}")
         return {"error": str(e), "raw": raw_text}
+
+async def analyze_batch_async(requests: list[tuple[list[int], str]], imgs: list) -> list:
+    """Answer several requests over one numbered image list with a single Gemini call.
+
+    Returns one {"detected_ingredients", "recipes"} result per request, or
+    None where the answer for that request is missing or malformed. Recipe
+    images are left to the caller.
+    """
+    parts = [build_batch_prompt(requests)]
+    for number, img in enumerate(imgs, 1):
+        parts += [f"이미지 {number}:", img.as_part()]
+    response = await generate_json(parts)
+    with tracing.span("parse"):
+        data = parse_response_text(response.text)
+
+    answers = {}
+    for entry in (data.get("results") if isinstance(data, dict) else None) or []:
+        if not isinstance(entry, dict) or not isinstance(entry.get("recipes"), list):
+            continue
+        try:
+            number = int(entry.get("request"))
+        except (TypeError, ValueError):
+            continue
+        answers[number] = {
+            "detected_ingredients": [str(item) for item in entry.get("detected_ingredients") or []],
+            "recipes": [recipe for recipe in entry["recipes"] if isinstance(recipe, dict) and recipe.get("name")],
+        }
+    return [answers.get(i + 1) for i in range(len(requests))]
+
+async def _pump_gemini_stream(parts: list, parser: RecipeStreamParser, recipes: list, events: asyncio.Queue):
+    """Read the Gemini stream into events, ending with None or the exception raised.
+
+    The limiter slot is only held while Gemini is generating; the events
+    queue absorbs a client that reads slower than the model writes, so a
+    slow reader cannot keep a shared slot busy.
+    """
+    try:
+        async with rate_limiter.gemini.slot():
+            with tracing.span("gemini_stream"):
+                response = await get_model().generate_content_async(
+                    parts,
+                    generation_config={"response_mime_type": "application/json"},
+                    stream=True
+                )
+                async for chunk in response:
+                    for kind, value in parser.feed(chunk.text):
+                        if kind == "recipe":
+                            food_images.schedule_recipe_images([value])
+                            recipes.append(value)
+                        events.put_nowait((kind, value))
+        events.put_nowait(None)
+    except Exception as e:
+        events.put_nowait(e)
+
+async def stream_fridge_analysis(image_paths: list[str], user_prompt: str = ""):
+    """Stream the analysis as (kind, value) events.
+
+    Yields ("detected_ingredients", list) and ("recipe", dict) as soon as each
+    piece of the model output is complete, then ("done", full_result) or
+    ("error", message). Recipe images are always fetched in the background
+    here so a recipe is never held back waiting for its thumbnail.
+    """
+    try:
+        imgs = await image_preprocess.prepare_images_async(image_paths)
+    except Exception as e:
+        yield ("error", f"Failed to open image: {str(e)}")
+        return
+
+    cache_key = analysis_cache.make_key(imgs, user_prompt)
+    cached = analysis_cache.cache.get(cache_key)
+    if cached is not None:
+        print(f"[AI Chef] Cache hit for analysis {cache_key[:12]}")
+        food_images.refresh_recipe_images(cached)
+        yield ("detected_ingredients", cached.get("detected_ingredients", []))
+        for recipe in cached.get("recipes", []):
+            yield ("recipe", recipe)
+        yield ("done", cached)
+        return
+
+    parts = [build_prompt(user_prompt), *[img.as_part() for img in imgs]]
+    limiter = rate_limiter.gemini
+    max_retries = limiter.max_retries
+    
+    for attempt in range(max_retries):
+        parser = RecipeStreamParser()
+        recipes = []
+        events = asyncio.Queue()
+        pump = asyncio.create_task(_pump_gemini_stream(parts, parser, recipes, events))
+        try:
+            try:
+                while (event := await events.get()) is not None:
+                    if isinstance(event, Exception):
+                        raise event
+                    yield event
+            finally:
+                # Stops the Gemini stream if the client went away; a no-op once it has finished
+                pump.cancel()
+            limiter.record_success()
+            break
+        except rate_limiter.LimiterBusy as e:
+            yield ("error", str(e))
+            return
+        except Exception as e:
+            # Only retry if nothing has reached the client yet
+            if parser.text == "" and attempt < max_retries - 1 and rate_limiter.is_rate_limit_error(e):
+                retry_delay = limiter.record_rate_limited(e, attempt)
+                print(f"[AI Chef] Rate limit hit. Retrying in {retry_delay:.1f} seconds... (Attempt {attempt + 1}/{max_retries})")
+                await asyncio.sleep(retry_delay)
+                continue
+            limiter.record_failure()
+            print(f"Error in AI Agent: {e}")
+            print(f"Raw Text: {parser.text}")
+            yield ("error", str(e))
+            return
+
+    try:
+        data = parse_response_text(parser.text)
+    except ValueError as e:
+        print(f"Error in AI Agent: {e}")
+        print(f"Raw Text: {parser.text}")
+        yield ("error", str(e))
+        return
+    # Keep the recipe objects that already carry their reserved image_path
+    data["recipes"] = recipes
+    analysis_cache.cache.set(cache_key, data)
+    yield ("done", data)
+
+def analyze_fridge_image(image_paths: list[str], user_prompt: str = ""):
+    """Synchronous wrapper for scripts and non-async callers."""
+    return asyncio.run(analyze_fridge_image_async(image_paths, user_prompt))
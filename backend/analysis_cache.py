@@ -0,0 +1,130 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", 256))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", 24 * 60 * 60))
+# Leave empty to keep the cache in memory only
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", "")
+
+LOOKUPS = metrics.Counter("analysis_cache_lookups_total", "Analysis cache lookups by outcome", ["outcome"])
+
+
+def make_key(images, user_prompt: str) -> str:
+    """Hash the preprocessed image bytes plus the prompt.
+
+    Images are hashed after EXIF rotation, resizing and re-encoding, which are
+    deterministic, so the same photo re-uploaded with a different filename or
+    metadata still hits the cache.
+    """
+    h = hashlib.sha256()
+    for img in images:
+        h.update(f"{img.mime_type}:{len(img.data)}:".encode())
+        h.update(img.data)
+    h.update(b"\0")
+    h.update(" ".join(user_prompt.split()).encode())
+    return h.hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, max_size: int = ANALYSIS_CACHE_SIZE, ttl: float = ANALYSIS_CACHE_TTL, cache_dir: str = ANALYSIS_CACHE_DIR):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key: str):
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, result: dict):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.part"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[AI Chef] Failed to write analysis cache entry {key}: {e}")
+
+    def _put_memory(self, key: str, result: dict):
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if time.monotonic() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    LOOKUPS.inc(outcome="hit")
+                    return copy.deepcopy(result)
+                del self._entries[key]
+                self.evictions += 1
+
+        if self.cache_dir:
+            result = self._read_disk(key)
+            if result is not None:
+                with self._lock:
+                    self._put_memory(key, result)
+                    self.disk_hits += 1
+                LOOKUPS.inc(outcome="disk_hit")
+                return copy.deepcopy(result)
+
+        with self._lock:
+            self.misses += 1
+        LOOKUPS.inc(outcome="miss")
+        return None
+
+    def set(self, key: str, result: dict):
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._put_memory(key, result)
+        if self.cache_dir:
+            self._write_disk(key, result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+cache = AnalysisCache()
+metrics.Gauge("analysis_cache_entries", "Analysis results held in memory", callback=lambda: len(cache._entries))
@@ -1,5 +1,10 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
@@ -12,14 +17,38 @@ SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Resolved users are cached per token for a short time so authenticated
+# requests skip the users lookup. Set AUTH_CACHE_TTL=0 to disable.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+
+_principal_cache = OrderedDict()  # token -> (expires_at, user)
+_principal_lock = threading.Lock()
+
+# bcrypt is deliberately slow (~100-300 ms at 12 rounds). All hashing runs on a
+# small dedicated pool so a burst of logins cannot starve the event loop or
+# the request threadpool; size it to the cores you can spare.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwd-hash")
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return _hash_executor.submit(pwd_context.verify, plain_password, hashed_password).result()
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _hash_executor.submit(pwd_context.hash, password).result()
+
+async def verify_password_async(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.verify, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -31,7 +60,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _cached_principal(token: str):
+    with _principal_lock:
+        entry = _principal_cache.get(token)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if time.time() >= expires_at:
+            del _principal_cache[token]
+            return None
+        _principal_cache.move_to_end(token)
+        return user
+
+def _cache_principal(token: str, user, token_exp: float):
+    with _principal_lock:
+        _principal_cache[token] = (min(time.time() + AUTH_CACHE_TTL, token_exp), user)
+        _principal_cache.move_to_end(token)
+        while len(_principal_cache) > AUTH_CACHE_SIZE:
+            _principal_cache.popitem(last=False)
+
+def invalidate_user(user_id: int):
+    """Drop every cached principal for this user, e.g. after a username or password change."""
+    with _principal_lock:
+        for token in [t for t, (_, user) in _principal_cache.items() if user.id == user_id]:
+            del _principal_cache[token]
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+    if AUTH_CACHE_TTL > 0:
+        user = _cached_principal(token)
+        if user is not None:
+            return user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -48,4 +107,8 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(models.User).filter(models.User.username == token_data.username).first()
     if user is None:
         raise credentials_exception
+    if AUTH_CACHE_TTL > 0:
+        # Detach so a later commit in this session cannot expire the cached copy
+        db.expunge(user)
+        _cache_principal(token, user, payload.get("exp", time.time()))
     return user
@@ -0,0 +1,158 @@
+import os
+import asyncio
+from dataclasses import dataclass, field
+
+import ai_agent
+import analysis_cache
+import food_images
+import image_preprocess
+import metrics
+import rate_limiter
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 50))
+# Up to this many items (and distinct images) share one Gemini call
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", 4))
+BATCH_PACK_MAX_IMAGES = int(os.getenv("BATCH_PACK_MAX_IMAGES", 8))
+# Gemini calls one batch may have in flight; the shared limiter still applies on top
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+# Finished items are written to history this many rows per commit
+BATCH_SAVE_SIZE = int(os.getenv("BATCH_SAVE_SIZE", 20))
+
+CALLS = metrics.Counter("batch_gemini_calls_total", "Gemini calls made for batch items by kind", ["kind"])
+ITEMS = metrics.Counter("batch_items_total", "Batch items by outcome", ["outcome"])
+
+
+@dataclass
+class BatchItem:
+    index: int
+    prompt: str
+    image_paths: list[str]
+    imgs: list = field(default_factory=list)
+    cache_key: str = None
+
+
+def pack_items(items: list[BatchItem], pack_size: int = BATCH_PACK_SIZE, max_images: int = BATCH_PACK_MAX_IMAGES) -> list[list[BatchItem]]:
+    """Group items, in order, into calls of at most pack_size items and max_images distinct images.
+
+    Items over the same photos (e.g. history re-run with new prompts) share
+    the images in the call, so they only count once.
+    """
+    packs = []
+    current, paths = [], set()
+    for item in items:
+        merged = paths | set(item.image_paths)
+        if current and (len(current) >= pack_size or len(merged) > max_images):
+            packs.append(current)
+            current, merged = [], set(item.image_paths)
+        current.append(item)
+        paths = merged
+    if current:
+        packs.append(current)
+    return packs
+
+
+async def _prepare(items: list[BatchItem]) -> dict:
+    """Preprocess each distinct path once; returns path -> PreparedImage or the exception it raised."""
+    paths = list(dict.fromkeys(path for item in items for path in item.image_paths))
+    prepared = await asyncio.gather(*[image_preprocess.prepare_images_async([path]) for path in paths], return_exceptions=True)
+    return {path: imgs if isinstance(imgs, Exception) else imgs[0] for path, imgs in zip(paths, prepared)}
+
+
+def _finish(item: BatchItem, result: dict) -> dict:
+    # Batch results are streamed as soon as they exist, so thumbnails always download in the background
+    food_images.schedule_recipe_images(result["recipes"])
+    analysis_cache.cache.set(item.cache_key, result)
+    return result
+
+
+async def _run_single(item: BatchItem, semaphore: asyncio.Semaphore) -> dict:
+    CALLS.inc(kind="single")
+    async with semaphore:
+        return await ai_agent.analyze_prepared_async(item.imgs, item.prompt)
+
+
+async def _run_pack(pack: list[BatchItem], semaphore: asyncio.Semaphore, emit):
+    if len(pack) == 1:
+        emit(pack[0], await _run_single(pack[0], semaphore))
+        return
+
+    paths = list(dict.fromkeys(path for item in pack for path in item.image_paths))
+    numbers = {path: i + 1 for i, path in enumerate(paths)}
+    by_path = {path: img for item in pack for path, img in zip(item.image_paths, item.imgs)}
+    requests = [([numbers[path] for path in item.image_paths], item.prompt) for item in pack]
+
+    CALLS.inc(kind="packed")
+    try:
+        async with semaphore:
+            answers = await ai_agent.analyze_batch_async(requests, [by_path[path] for path in paths])
+    except rate_limiter.LimiterBusy:
+        raise
+    except Exception as e:
+        print(f"[AI Chef] Packed analysis of {len(pack)} items failed, retrying one by one: {e}")
+        answers = [None] * len(pack)
+
+    retry = []
+    for item, answer in zip(pack, answers):
+        if answer is None:
+            retry.append(item)
+        else:
+            emit(item, _finish(item, answer))
+    if retry:
+        print(f"[AI Chef] {len(retry)} of {len(pack)} packed items had no usable answer, retrying one by one")
+        results = await asyncio.gather(*[_run_single(item, semaphore) for item in retry], return_exceptions=True)
+        for item, result in zip(retry, results):
+            emit(item, {"error": str(result)} if isinstance(result, Exception) else result)
+
+
+async def analyze_batch(items: list[BatchItem], concurrency: int = BATCH_CONCURRENCY):
+    """Yield (index, result) for every item as soon as it is finished.
+
+    Cached items come first, then items are packed several to a Gemini
+    call; packs run concurrently, at most `concurrency` calls at a time.
+    A packed item the model did not answer properly is retried on its own.
+    result is the same dict /analyze returns, or {"error": message}.
+    """
+    done = asyncio.Queue()
+    finished = set()
+
+    def emit(item: BatchItem, result: dict, outcome: str = None):
+        if item.index in finished:
+            return
+        finished.add(item.index)
+        ITEMS.inc(outcome=outcome or ("error" if "error" in result else "ok"))
+        done.put_nowait((item.index, result))
+
+    prepared = await _prepare(items)
+    pending = []
+    for item in items:
+        failed = next((prepared[path] for path in item.image_paths if isinstance(prepared[path], Exception)), None)
+        if failed is not None:
+            emit(item, {"error": f"Failed to open image: {failed}"})
+            continue
+        item.imgs = [prepared[path] for path in item.image_paths]
+        item.cache_key = analysis_cache.make_key(item.imgs, item.prompt)
+        cached = analysis_cache.cache.get(item.cache_key)
+        if cached is not None:
+            emit(item, food_images.refresh_recipe_images(cached), "cached")
+        else:
+            pending.append(item)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(pack: list[BatchItem]):
+        try:
+            await _run_pack(pack, semaphore, emit)
+        except Exception as e:
+            # Items the pack already answered are skipped by emit
+            for item in pack:
+                emit(item, {"error": str(e)})
+
+    # Tasks copy the current context, so their stage timings land in the caller's trace
+    tasks = [asyncio.create_task(run(pack)) for pack in pack_items(pending)]
+    try:
+        for _ in range(len(items)):
+            yield await done.get()
+    finally:
+        # The client may stop reading part-way through
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,89 @@
+"""Favorite lookup/delete cost for a user with many favorites.
+
+Usage (from backend/):
+    python benchmarks/bench_favorites.py [--favorites 10000] [--repeat 50] [--db-url sqlite://]
+
+Compares the old approach (load every favorite and compare
+recipe_data['name'] in Python) with the indexed recipe_name query, and
+times the deduplicating add.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+import crud, database, models, schemas
+
+
+def make_recipe(i: int) -> dict:
+    return {
+        "name": f"Recipe {i}",
+        "english_name": f"Recipe {i}",
+        "ingredients": [f"ingredient {j}" for j in range(8)],
+        "instructions": "1. Chop.\n2. Cook.\n3. Serve." * 5,
+    }
+
+
+def legacy_find(db, name: str, user_id: int):
+    for fav in db.query(models.Favorite).filter(models.Favorite.user_id == user_id).all():
+        if fav.recipe_data.get('name') == name:
+            return fav
+    return None
+
+
+def indexed_find(db, name: str, user_id: int):
+    # The lookup crud.delete_favorite runs, served by ix_favorites_user_name
+    return db.query(models.Favorite).filter(models.Favorite.user_id == user_id, models.Favorite.recipe_name == name).all()
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--favorites", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--db-url", default="sqlite://")
+    args = parser.parse_args()
+
+    engine = database.build_engine(args.db_url)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    user = models.User(username=f"bench_{int(time.time())}", hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    db.bulk_insert_mappings(models.Favorite, [
+        {"user_id": user.id, "stored_recipe_data": r, "recipe_name": r["name"], "recipe_hash": crud.recipe_hash(r)}
+        for r in (make_recipe(i) for i in range(args.favorites))
+    ])
+    db.commit()
+
+    # Worst case for the scan: the target is the last row
+    target = f"Recipe {args.favorites - 1}"
+    legacy = timed(lambda: (legacy_find(db, target, user.id), db.expire_all()), args.repeat)
+    indexed = timed(lambda: indexed_find(db, target, user.id), args.repeat)
+    dedup_add = timed(lambda: crud.create_favorite(db, schemas.FavoriteCreate(recipe_data=make_recipe(args.favorites - 1)), user.id), args.repeat)
+
+    start = time.perf_counter()
+    crud.delete_favorite(db, target, user.id)
+    delete = time.perf_counter() - start
+
+    print(f"favorites:             {args.favorites}")
+    print(f"legacy scan lookup:    {legacy * 1000:.2f} ms")
+    print(f"indexed lookup:        {indexed * 1000:.2f} ms ({legacy / indexed:.0f}x faster)")
+    print(f"add (already present): {dedup_add * 1000:.2f} ms")
+    print(f"indexed delete:        {delete * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
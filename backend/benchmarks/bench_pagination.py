@@ -0,0 +1,67 @@
+"""Offset vs keyset (cursor) pagination over a large history.
+
+Usage (from backend/):
+    python benchmarks/bench_pagination.py [--rows 100000] [--limit 5] [--db-url sqlite:///./bench_pagination.db]
+
+Seeds one user with --rows history rows, then times fetching pages at
+increasing depths with offset/limit and with the id cursor.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+import crud, database, models
+
+RESULT = {
+    "detected_ingredients": ["egg", "spinach", "onion"],
+    "recipes": [{"name": "Omelette", "ingredients": ["egg 2"], "instructions": "1. Beat.\n2. Fry."}],
+}
+
+
+def timed(fn, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--db-url", default="sqlite://")
+    args = parser.parse_args()
+
+    engine = database.build_engine(args.db_url)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    user = models.User(username=f"bench_{int(time.time())}", hashed_password="x")
+    db.add(user)
+    db.commit()
+    for start in range(0, args.rows, 10000):
+        db.bulk_insert_mappings(models.History, [
+            {"user_id": user.id, "prompt_text": "bench", "input_image_path": "uploads/x.jpg", "stored_result": RESULT}
+            for _ in range(start, min(args.rows, start + 10000))
+        ])
+        db.commit()
+
+    newest_id = crud.get_histories(db, user.id, limit=1)[0].id
+    print(f"{'depth (rows)':>12} {'offset ms':>10} {'cursor ms':>10}")
+    for depth in (0, 1000, 10000, 50000, args.rows - args.limit):
+        if depth >= args.rows:
+            continue
+        # Ids are contiguous here, so the cursor for this depth is newest_id - depth + 1
+        before_id = newest_id - depth + 1
+        offset_ms = timed(lambda: (crud.get_histories(db, user.id, skip=depth, limit=args.limit), db.expire_all())) * 1000
+        cursor_ms = timed(lambda: (crud.get_histories(db, user.id, limit=args.limit, before_id=before_id), db.expire_all())) * 1000
+        print(f"{depth:>12} {offset_ms:>10.2f} {cursor_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Measure what image preprocessing saves on a folder of fridge photos.
+
+Usage (from backend/):
+    python benchmarks/bench_preprocess.py path/to/photos [--gemini] [--max-edge 1536] [--format JPEG] [--quality 85]
+
+Reports the bytes that would be uploaded to Gemini with and without
+preprocessing, and the preprocessing time. With --gemini it also calls the
+model once with raw files and once with prepared images and reports the
+end-to-end latency of each (needs GEMINI_API_KEY).
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_preprocess
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic")
+
+
+def _gemini_latency(parts: list) -> float:
+    import ai_agent
+    start = time.perf_counter()
+    ai_agent.get_model().generate_content(
+        [ai_agent.build_prompt(""), *parts],
+        generation_config={"response_mime_type": "application/json"}
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder")
+    parser.add_argument("--gemini", action="store_true", help="also measure end-to-end Gemini latency")
+    parser.add_argument("--max-edge", type=int, default=image_preprocess.IMAGE_MAX_EDGE)
+    parser.add_argument("--format", default=image_preprocess.IMAGE_FORMAT)
+    parser.add_argument("--quality", type=int, default=image_preprocess.IMAGE_QUALITY)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.folder, name) for name in os.listdir(args.folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        sys.exit(f"No images found in {args.folder}")
+
+    start = time.perf_counter()
+    prepared = list(image_preprocess._executor.map(
+        lambda p: image_preprocess.prepare_image(p, args.max_edge, args.format.upper(), args.quality), paths
+    ))
+    elapsed = time.perf_counter() - start
+
+    raw_bytes = sum(img.original_size for img in prepared)
+    sent_bytes = sum(len(img.data) for img in prepared)
+    print(f"images:          {len(paths)}")
+    print(f"raw bytes:       {raw_bytes}")
+    print(f"sent bytes:      {sent_bytes} ({sent_bytes / raw_bytes:.1%} of raw)")
+    print(f"preprocess time: {elapsed * 1000:.1f} ms total, {elapsed * 1000 / len(paths):.1f} ms/image")
+
+    if args.gemini:
+        import PIL.Image
+        raw_parts = [PIL.Image.open(p).convert('RGB') for p in paths]
+        print(f"gemini raw:      {_gemini_latency(raw_parts):.2f} s")
+        print(f"gemini prepared: {_gemini_latency([img.as_part() for img in prepared]):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
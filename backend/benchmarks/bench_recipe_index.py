@@ -0,0 +1,64 @@
+"""Ingredient search latency over a large recipe index.
+
+Usage (from backend/):
+    python benchmarks/bench_recipe_index.py [--recipes 100000] [--vocab 800] [--queries 2000]
+
+Fills one user's index with --recipes synthetic recipes (8 ingredients
+each, drawn from a skewed vocabulary so staples like salt show up in
+most recipes), then times recipe_index.search for 1-4 ingredient
+queries. The database is not involved: the user's index is filled
+directly, the same way crud keeps it current after the first load.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import recipe_index
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import summarize
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--vocab", type=int, default=800)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocab = [f"ingredient{i}" for i in range(args.vocab)]
+    # Zipf-like weights: a few staples, a long tail of rare ingredients
+    weights = [1 / (i + 1) for i in range(args.vocab)]
+
+    index = recipe_index.RecipeIndex()
+    user_index = recipe_index._UserIndex()
+    index._users[1] = user_index
+
+    start = time.perf_counter()
+    for history_id in range(1, args.recipes + 1):
+        lines = [f"{name} 1개" for name in set(rng.choices(vocab, weights, k=8))]
+        entry = recipe_index.IndexedRecipe(history_id, f"Recipe {history_id}", None, None, recipe_index.ingredient_terms(lines))
+        index.add_history(1, history_id, rng.choices(vocab, weights, k=6), [entry])
+    build = time.perf_counter() - start
+
+    print(f"recipes indexed: {args.recipes} in {build:.1f} s")
+    for size in (1, 2, 4):
+        samples = []
+        for _ in range(args.queries):
+            query = rng.choices(vocab, weights, k=size)
+            start = time.perf_counter()
+            index.search(None, 1, query, limit=args.limit)
+            samples.append(time.perf_counter() - start)
+        report = summarize(samples)
+        print(f"{size} ingredient(s): p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, p99 {report['p99_ms']} ms, max {report['max_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
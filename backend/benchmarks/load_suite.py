@@ -0,0 +1,318 @@
+"""Offline load test of the whole service: no Gemini key, no Bing, no MySQL.
+
+Usage (from backend/):
+    python benchmarks/load_suite.py --requests 200 --concurrency 20 \
+        --gemini-latency 1.5 --gemini-429-rate 0.05 --output run.json
+    python benchmarks/load_suite.py ... --compare baseline.json
+
+Starts the app with uvicorn on a free port, backed by a fresh SQLite file
+and a temporary upload directory, and swaps in:
+  - a fake Gemini model (ai_agent.model) that answers with canned recipes
+    after --gemini-latency seconds (+/- --gemini-jitter), failing
+    --gemini-429-rate of calls with a rate-limit error and
+    --gemini-error-rate with a generic one;
+  - a local image server, used through IMAGE_SEARCH_URL, that returns a
+    JPEG after --image-latency seconds.
+
+It then drives POST /token, POST /analyze, GET /history, POST /favorites
+and GET /favorites at --concurrency, one endpoint at a time, and prints
+a JSON report with throughput and p50/p95/p99 per endpoint (plus the
+fake Gemini call counts). --output writes the same report to a file and
+--compare prints the p95 and throughput change against an earlier one.
+
+Every /analyze uses a distinct prompt so the analysis cache never
+answers; pass --cacheable to send the same prompt and measure cache hits.
+"""
+import os
+import io
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from loadgen import Client, run_load
+
+DISHES = [
+    ("김치볶음밥", "Kimchi Fried Rice"),
+    ("토마토 달걀볶음", "Tomato Egg Stir-fry"),
+    ("된장찌개", "Soybean Paste Stew"),
+    ("시금치 달걀말이", "Spinach Rolled Omelette"),
+    ("감자조림", "Braised Potatoes"),
+    ("두부조림", "Braised Tofu"),
+    ("잡채", "Japchae"),
+    ("계란찜", "Steamed Eggs"),
+]
+INGREDIENTS = ["달걀", "김치", "양파", "대파", "두부", "감자", "시금치", "토마토", "당근", "돼지고기"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def jpeg_bytes(size=(800, 500), color=(200, 120, 60)) -> bytes:
+    import PIL.Image
+    buf = io.BytesIO()
+    PIL.Image.new("RGB", size, color).save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class FakeRateLimit(Exception):
+    code = 429
+
+    def __init__(self):
+        super().__init__("429 Resource exhausted: quota exceeded (fake)")
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeStream:
+    def __init__(self, text: str, chunk_size: int = 200):
+        self._chunks = [FakeResponse(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel with canned JSON answers."""
+
+    def __init__(self, latency: float, jitter: float, rate_limit_rate: float, error_rate: float, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = {"ok": 0, "rate_limited": 0, "error": 0}
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        """(outcome, dishes, detected ingredients) for one call."""
+        with self._lock:
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                outcome = "rate_limited"
+            elif roll < self.rate_limit_rate + self.error_rate:
+                outcome = "error"
+            else:
+                outcome = "ok"
+            self.calls[outcome] += 1
+            return outcome, self.random.sample(DISHES, 3), self.random.sample(INGREDIENTS, 5)
+
+    def _answer(self, dishes, detected) -> str:
+        return json.dumps({
+            "detected_ingredients": detected,
+            "recipes": [
+                {
+                    "name": name,
+                    "english_name": english_name,
+                    "ingredients": [f"{item} 1개" for item in detected[:4]] + ["소금 약간"],
+                    "instructions": "1. 재료를 손질한다.\n2. 팬에 볶는다.\n3. 간을 맞춘다.",
+                }
+                for name, english_name in dishes
+            ],
+        }, ensure_ascii=False)
+
+    async def generate_content_async(self, parts, generation_config=None, stream=False):
+        outcome, dishes, detected = self._roll()
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if outcome == "rate_limited":
+            raise FakeRateLimit()
+        if outcome == "error":
+            raise RuntimeError("500 Internal error (fake)")
+        text = self._answer(dishes, detected)
+        return FakeStream(text) if stream else FakeResponse(text)
+
+
+def start_image_server(latency: float) -> ThreadingHTTPServer:
+    body = jpeg_bytes()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", free_port()), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(port: int, fake_model: FakeModel):
+    import uvicorn
+    import ai_agent
+    import main
+
+    ai_agent.model = fake_model
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    # Signals stay with the main thread
+    server.install_signal_handlers = lambda: None
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            sys.exit("uvicorn did not start")
+        time.sleep(0.05)
+    return server
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report: dict, baseline: dict):
+    print(f"\n{'endpoint':<18} {'p95 ms':>10} {'baseline':>10} {'change':>8}   {'rps':>8} {'baseline':>9} {'change':>8}")
+    for name, current in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        p95_change = (current["p95_ms"] / before["p95_ms"] - 1) if before["p95_ms"] else 0.0
+        rps, base_rps = current.get("throughput_rps", 0), before.get("throughput_rps", 0)
+        rps_change = (rps / base_rps - 1) if base_rps else 0.0
+        print(f"{name:<18} {current['p95_ms']:>10} {before['p95_ms']:>10} {p95_change:>+8.1%}   {rps:>8} {base_rps:>9} {rps_change:>+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--analyze-requests", type=int, default=None, help="defaults to --requests")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=None, help="distinct users, defaults to --concurrency")
+    parser.add_argument("--gemini-latency", type=float, default=1.0)
+    parser.add_argument("--gemini-jitter", type=float, default=0.2)
+    parser.add_argument("--gemini-429-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-rpm", type=float, default=100000, help="limiter rate; the real default is 60")
+    parser.add_argument("--image-latency", type=float, default=0.1)
+    parser.add_argument("--cacheable", action="store_true", help="same prompt every time so the analysis cache answers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aichef-bench-")
+    image_server = start_image_server(args.image_latency)
+    # Must be set before the app modules are imported
+    os.environ.update({
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": os.path.join(workdir, "bench.db"),
+        "STORAGE_BACKEND": "local",
+        "STORAGE_ROOT": workdir,
+        "IMAGE_SEARCH_URL": f"http://127.0.0.1:{image_server.server_address[1]}/th?q={{query}}",
+        "GEMINI_RPM": str(args.gemini_rpm),
+        "GEMINI_BURST": str(max(5, args.concurrency)),
+        "GEMINI_MAX_CONCURRENCY": str(max(8, args.concurrency)),
+        "GEMINI_MAX_QUEUE": str(max(32, args.concurrency * 2)),
+        "GEMINI_BACKOFF_BASE": "0.2",
+        "GEMINI_BACKOFF_MAX": "2",
+        "BCRYPT_ROUNDS": os.environ.get("BCRYPT_ROUNDS", "4"),
+        "SLOW_REQUEST_SECONDS": "0",
+    })
+
+    fake_model = FakeModel(args.gemini_latency, args.gemini_jitter, args.gemini_429_rate, args.gemini_error_rate, args.seed)
+    port = free_port()
+    start_app(port, fake_model)
+    client = Client(f"http://127.0.0.1:{port}")
+
+    users = args.users or args.concurrency
+    credentials = [(f"bench_user_{i}", f"bench_password_{i}") for i in range(users)]
+    tokens = [client.login(username, password) for username, password in credentials]
+    photos = [jpeg_bytes((1600, 1200), (40 * i % 256, 90, 160)) for i in range(8)]
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+
+    def next_index() -> int:
+        with counter_lock:
+            return next(counter)
+
+    def token_login():
+        username, password = credentials[next_index() % users]
+        status, _, seconds = client.form("/token", {"username": username, "password": password})
+        return status == 200, seconds
+
+    def analyze():
+        i = next_index()
+        prompt = "bench" if args.cacheable else f"bench {i}"
+        status, _, seconds = client.multipart(
+            "/analyze", {"prompt": prompt},
+            [("files", f"fridge_{i % len(photos)}.jpg", "image/jpeg", photos[i % len(photos)])],
+            tokens[i % users],
+        )
+        return status == 200, seconds
+
+    def history():
+        status, _, seconds = client.get("/history?limit=20", tokens[next_index() % users])
+        return status == 200, seconds
+
+    def add_favorite():
+        i = next_index()
+        name, english_name = DISHES[i % len(DISHES)]
+        recipe = {"name": f"{name} {i}", "english_name": english_name, "ingredients": ["달걀 2개"], "instructions": "1. 굽는다."}
+        status, _, seconds = client.json("POST", "/favorites", {"recipe_data": recipe}, tokens[i % users])
+        return status == 200, seconds
+
+    def favorites():
+        status, _, seconds = client.get("/favorites?limit=20", tokens[next_index() % users])
+        return status == 200, seconds
+
+    endpoints = {
+        "POST /token": (token_login, args.requests),
+        "POST /analyze": (analyze, args.analyze_requests or args.requests),
+        "GET /history": (history, args.requests),
+        "POST /favorites": (add_favorite, args.requests),
+        "GET /favorites": (favorites, args.requests),
+    }
+    results = {}
+    for name, (fn, total) in endpoints.items():
+        results[name] = run_load(fn, total, args.concurrency)
+        print(f"[bench] {name}: {results[name]}", file=sys.stderr)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "endpoints": results,
+        "gemini_calls": fake_model.calls,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    image_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
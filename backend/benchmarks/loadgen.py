@@ -0,0 +1,108 @@
+"""Small stdlib-only HTTP load generator shared by the benchmark scripts."""
+import json
+import time
+import uuid
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list[float], errors: int = 0, elapsed: float = None) -> dict:
+    summary = {
+        "count": len(samples),
+        "errors": errors,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(len(samples) / elapsed, 2)
+    return summary
+
+
+class Client:
+    def __init__(self, base_url: str, timeout: float = 120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, body: bytes = None, headers: dict = None):
+        """Return (status, body_bytes, seconds). Network errors come back as status 0."""
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers or {})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                data = resp.read()
+                return resp.status, data, time.perf_counter() - start
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), time.perf_counter() - start
+        except OSError:
+            return 0, b"", time.perf_counter() - start
+
+    def json(self, method: str, path: str, payload, token: str = None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return self.request(method, path, json.dumps(payload).encode(), headers)
+
+    def form(self, path: str, fields: dict):
+        body = urllib.parse.urlencode(fields).encode()
+        return self.request("POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"})
+
+    def multipart(self, path: str, fields: dict, files: list[tuple], token: str = None):
+        """files is a list of (field_name, filename, content_type, data)."""
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in fields.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, filename, content_type, data in files:
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n'.encode() + data + b"\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n".encode())
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return self.request("POST", path, b"".join(parts), headers)
+
+    def get(self, path: str, token: str = None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        return self.request("GET", path, headers=headers)
+
+    def login(self, username: str, password: str) -> str:
+        self.json("POST", "/signup", {"username": username, "password": password})
+        status, body, _ = self.form("/token", {"username": username, "password": password})
+        if status != 200:
+            raise RuntimeError(f"login failed for {username}: {status} {body[:200]!r}")
+        return json.loads(body)["access_token"]
+
+
+def run_load(fn, total: int, concurrency: int) -> dict:
+    """Call fn() total times from concurrency threads; fn returns (ok, seconds)."""
+    samples, errors = [], 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        ok, seconds = fn()
+        with lock:
+            if ok:
+                samples.append(seconds)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return summarize(samples, errors, time.perf_counter() - start)
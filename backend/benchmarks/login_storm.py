@@ -0,0 +1,77 @@
+"""Login storm against a running backend.
+
+Usage (from backend/, with the server already running):
+    python benchmarks/login_storm.py --url http://localhost:8000 --logins 200 --concurrency 50
+
+Fires concurrent POST /token requests and, at the same time, keeps calling
+an unrelated endpoint (GET /users/me by default) to show how much a burst
+of bcrypt work slows everything else down. Prints a JSON report with
+p50/p95/p99 for logins and for the probe endpoint before and during the
+storm. Compare runs with different BCRYPT_ROUNDS / PASSWORD_HASH_WORKERS.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import Client, run_load, summarize
+
+
+def probe(client: Client, path: str, token: str, stop: threading.Event, samples: list, interval: float):
+    while not stop.is_set():
+        status, _, seconds = client.get(path, token)
+        if status == 200:
+            samples.append(seconds)
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--probe-path", default="/users/me")
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--username", default="loadtest_user")
+    parser.add_argument("--password", default="loadtest_password")
+    args = parser.parse_args()
+
+    client = Client(args.url)
+    token = client.login(args.username, args.password)
+
+    baseline = []
+    for _ in range(50):
+        status, _, seconds = client.get(args.probe_path, token)
+        if status == 200:
+            baseline.append(seconds)
+
+    during = []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(client, args.probe_path, token, stop, during, args.probe_interval))
+    prober.start()
+
+    def login():
+        status, _, seconds = client.form("/token", {"username": args.username, "password": args.password})
+        return status == 200, seconds
+
+    try:
+        logins = run_load(login, args.logins, args.concurrency)
+    finally:
+        stop.set()
+        prober.join()
+
+    print(json.dumps({
+        "logins": logins,
+        "probe_baseline": summarize(baseline),
+        "probe_during_storm": summarize(during),
+        "probe_path": args.probe_path,
+        "concurrency": args.concurrency,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
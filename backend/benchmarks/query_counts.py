@@ -0,0 +1,112 @@
+"""Database round trips per endpoint, with assertions.
+
+Usage (from backend/):
+    python benchmarks/query_counts.py
+
+Runs the app in-process against an in-memory SQLite database (needs
+httpx for FastAPI's TestClient) with the principal cache off, and
+counts, for each request, the statements executed and the pooled
+connections checked out. Exits non-zero if a request checks out more
+than one connection (auth and the handler must share the request's
+session) or if a write endpoint issues a SELECT after its COMMIT (the
+refresh round trip crud no longer does).
+"""
+import os
+import sys
+
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ["AUTH_CACHE_TTL"] = "0"
+os.environ["BCRYPT_ROUNDS"] = "4"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from fastapi.testclient import TestClient
+
+import database
+import main
+
+RECIPE = {
+    "name": "시금치 달걀말이",
+    "english_name": "Spinach Rolled Omelette",
+    "ingredients": ["달걀 3개", "시금치 1줌", "소금 약간"],
+    "instructions": "1. 달걀을 푼다.\n2. 시금치를 넣고 말아 익힌다.",
+}
+
+
+class Recorder:
+    def __init__(self, engine):
+        self.events = []
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+        event.listen(engine, "commit", lambda conn: self.events.append(("commit", "")))
+        event.listen(engine.pool, "checkout", lambda *args: self.events.append(("checkout", "")))
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.events.append(("sql", statement.lstrip().split(None, 1)[0].upper()))
+
+    def measure(self, fn):
+        self.events = []
+        response = fn()
+        assert response.status_code < 400, f"{response.status_code} {response.text[:200]}"
+        events = self.events
+        statements = [kind for event_kind, kind in events if event_kind == "sql"]
+        checkouts = sum(1 for event_kind, _ in events if event_kind == "checkout")
+        last_commit = max((i for i, (event_kind, _) in enumerate(events) if event_kind == "commit"), default=None)
+        after_commit = [] if last_commit is None else [
+            kind for event_kind, kind in events[last_commit + 1:] if event_kind == "sql"
+        ]
+        return response, statements, checkouts, after_commit
+
+
+def run():
+    # Entering the client runs the app's start-up, which creates the schema (DB_AUTO_MIGRATE)
+    with TestClient(main.app) as client:
+        measure(client)
+
+
+def measure(client):
+    recorder = Recorder(database.engine)
+    credentials = {"username": "query_counts", "password": "query_counts_pw"}
+
+    client.post("/signup", json=credentials)
+    token = client.post("/token", data=credentials).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    favorite_id = None
+    checks = [
+        ("GET /users/me", False, lambda: client.get("/users/me", headers=headers)),
+        ("PUT /users/me", True, lambda: client.put("/users/me", json={"profile_image": "uploads/query_counts.jpg"}, headers=headers)),
+        ("POST /favorites", True, lambda: client.post("/favorites", json={"recipe_data": RECIPE}, headers=headers)),
+        ("GET /favorites/summary", False, lambda: client.get("/favorites/summary", headers=headers)),
+        ("GET /favorites", False, lambda: client.get("/favorites", headers=headers)),
+        ("GET /history/summary", False, lambda: client.get("/history/summary", headers=headers)),
+        ("GET /recipes/search", False, lambda: client.get("/recipes/search", params={"ingredients": "달걀"}, headers=headers)),
+    ]
+
+    failures = []
+    print(f"{'endpoint':<24} {'statements':>10} {'connections':>12}  statements")
+    for name, writes, fn in checks:
+        response, statements, checkouts, after_commit = recorder.measure(fn)
+        if name == "POST /favorites":
+            favorite_id = response.json()["id"]
+        print(f"{name:<24} {len(statements):>10} {checkouts:>12}  {' '.join(statements)}")
+        if checkouts > 1:
+            failures.append(f"{name}: {checkouts} connections checked out")
+        if writes and "SELECT" in after_commit:
+            failures.append(f"{name}: SELECT after COMMIT")
+
+    response, statements, checkouts, _ = recorder.measure(
+        lambda: client.delete(f"/favorites/id/{favorite_id}", headers=headers)
+    )
+    print(f"{'DELETE /favorites/id':<24} {len(statements):>10} {checkouts:>12}  {' '.join(statements)}")
+    if checkouts > 1:
+        failures.append(f"DELETE /favorites/id: {checkouts} connections checked out")
+
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nok: one connection per request, no refresh after commit")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,111 @@
+"""Worker cold start: import time and time to first request.
+
+Usage (from backend/):
+    python benchmarks/startup.py [--runs 5] [--importtime]
+
+Each run uses a fresh interpreter, as a new uvicorn/gunicorn worker
+would. "import_s" is how long `import main` takes; "first_request_s" is
+the time from spawning `uvicorn main:app` until GET /metrics answers,
+which includes interpreter start, imports and the app's start-up hook.
+Runs against an in-memory database unless DB_BACKEND / DATABASE_URL is
+set. --importtime also lists the slowest imports (python -X importtime).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+METRICS_TOKEN = "startup-benchmark"
+
+IMPORT_SNIPPET = "import time; s = time.perf_counter(); import main; print(time.perf_counter() - s)"
+
+
+def environment() -> dict:
+    env = dict(os.environ)
+    env.setdefault("DB_BACKEND", "memory")
+    env["METRICS_TOKEN"] = METRICS_TOKEN
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_time() -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=environment(),
+        capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def first_request_time(timeout: float = 60) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=environment(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                request = urllib.request.Request(
+                    f"http://127.0.0.1:{port}/metrics", headers={"Authorization": f"Bearer {METRICS_TOKEN}"}
+                )
+                with urllib.request.urlopen(request, timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"server did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def slowest_imports(limit: int = 15) -> list[tuple]:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, env=environment(),
+        capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [(name, round(us / 1000, 1)) for us, name in rows[:limit]]
+
+
+def summary(samples: list[float]) -> dict:
+    return {"median_s": round(statistics.median(samples), 3), "min_s": round(min(samples), 3), "max_s": round(max(samples), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports")
+    args = parser.parse_args()
+
+    report = {
+        "import_s": summary([import_time() for _ in range(args.runs)]),
+        "first_request_s": summary([first_request_time() for _ in range(args.runs)]),
+    }
+    if args.importtime:
+        report["slowest_imports_ms"] = slowest_imports()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
-from sqlalchemy.orm import Session
-import models, schemas
-from auth import get_password_hash
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.exc import IntegrityError
+import base64
+import hashlib
+import json
+import re
+import models, schemas, recipe_index
+from auth import get_password_hash, invalidate_user
+from recipe_index import normalize_ingredient
 
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
@@ -13,48 +19,263 @@ def create_user(db: Session, user: schemas.UserCreate):
     db_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
     return db_user
 
-def update_user_profile(db: Session, user_id: int, profile_data: schemas.UserUpdate):
+def update_user_profile(db: Session, user_id: int, profile_data: schemas.UserUpdate, hashed_password: str = None):
+    """hashed_password, when given, is profile_data.password already hashed by the caller."""
     db_user = get_user(db, user_id)
     if not db_user:
         return None
     if profile_data.username:
         db_user.username = profile_data.username
     if profile_data.password:
-        db_user.hashed_password = get_password_hash(profile_data.password)
+        db_user.hashed_password = hashed_password or get_password_hash(profile_data.password)
     if profile_data.profile_image:
         db_user.profile_image = profile_data.profile_image
     db.commit()
-    db.refresh(db_user)
+    # Cached principals hold the old username/password hash/profile image
+    invalidate_user(user_id)
     return db_user
 
+def history_summary(analysis_result) -> dict:
+    recipes = (analysis_result.get("recipes") if isinstance(analysis_result, dict) else None) or []
+    return {
+        "recipe_names": [r.get("name") for r in recipes[:3]],
+        "recipe_count": len(recipes),
+    }
+
+def favorite_summary(recipe_data: dict) -> dict:
+    return {
+        "english_name": recipe_data.get("english_name"),
+        "image_path": recipe_data.get("image_path"),
+        "ingredients": (recipe_data.get("ingredients") or [])[:8],
+    }
+
+def get_or_create_ingredients(db: Session, names: set[str]) -> dict:
+    if not names:
+        return {}
+    found = {i.name: i for i in db.query(models.Ingredient).filter(models.Ingredient.name.in_(names))}
+    for name in names - found.keys():
+        try:
+            with db.begin_nested():
+                ingredient = models.Ingredient(name=name)
+                db.add(ingredient)
+            found[name] = ingredient
+        except IntegrityError:
+            found[name] = db.query(models.Ingredient).filter(models.Ingredient.name == name).one()
+    return found
+
+# Keys the food image pipeline writes: uploads/foodImgs/dish-<hash>.jpg (older rows: <uuid>.jpg)
+_FOOD_IMAGE_KEY = re.compile(r"^uploads/foodImgs/[A-Za-z0-9-]+\.jpg$")
+
+def food_image_key(image_path) -> str:
+    """image_path if it is a food image key, else None."""
+    return image_path if isinstance(image_path, str) and _FOOD_IMAGE_KEY.match(image_path) else None
+
+def get_or_create_recipe(db: Session, recipe_data: dict, image_path: str = None) -> models.Recipe:
+    """Return the stored recipe with this content, inserting it (not committed) if new.
+
+    Recipe rows are shared by every user, so image_path is passed separately
+    and only by callers whose recipes came from the food image pipeline;
+    recipe_data["image_path"] is never trusted.
+    """
+    image_path = food_image_key(image_path)
+    content_hash = recipe_hash(recipe_data)
+    recipe = db.query(models.Recipe).filter(models.Recipe.content_hash == content_hash).first()
+    if recipe is not None:
+        if not recipe.image_path and image_path:
+            recipe.image_path = image_path
+        return recipe
+
+    lines = [str(line) for line in recipe_data.get("ingredients") or []]
+    ingredients = get_or_create_ingredients(db, {n for n in map(normalize_ingredient, lines) if n})
+    recipe = models.Recipe(
+        name=(recipe_data.get("name") or "")[:255],
+        english_name=(recipe_data.get("english_name") or "")[:255] or None,
+        details=recipe_data.get("instructions"),
+        image_path=image_path,
+        content_hash=content_hash,
+    )
+    recipe.ingredient_links = [
+        models.RecipeIngredient(position=i, text=line[:255], ingredient=ingredients.get(normalize_ingredient(line)))
+        for i, line in enumerate(lines)
+    ]
+    try:
+        with db.begin_nested():
+            db.add(recipe)
+    except IntegrityError:
+        # Someone else stored the same recipe first
+        recipe = db.query(models.Recipe).filter(models.Recipe.content_hash == content_hash).one()
+    return recipe
+
+def bump_index_version(db: Session, user_id: int, changes: int = 1):
+    """Count index changes in the caller's transaction; must match the ops the caller applies to recipe_index.index."""
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.index_version: models.User.index_version + changes}, synchronize_session=False
+    )
+
 def create_history(db: Session, history: schemas.HistoryCreate, user_id: int):
-    db_history = models.History(**history.dict(), user_id=user_id)
-    db.add(db_history)
+    return create_histories(db, [history], user_id)[0]
+
+def create_histories(db: Session, histories: list[schemas.HistoryCreate], user_id: int):
+    """Insert several histories with one flush and one commit."""
+    rows = []
+    for history in histories:
+        result = history.analysis_result
+        db_history = models.History(
+            user_id=user_id,
+            prompt_text=history.prompt_text,
+            input_image_path=history.input_image_path,
+            input_images=history.input_images,
+            summary=history_summary(result),
+        )
+        if isinstance(result, dict) and isinstance(result.get("recipes"), list):
+            # Recipes go to the shared recipe store; the history row only keeps references
+            db_history.stored_result = {key: value for key, value in result.items() if key != "recipes"}
+            db_history.recipe_links = [
+                # Analysis results are server-generated, image_path included
+                models.HistoryRecipe(position=i, recipe=get_or_create_recipe(db, recipe, recipe.get("image_path")))
+                for i, recipe in enumerate(result["recipes"])
+            ]
+        else:
+            db_history.stored_result = result
+        rows.append((db_history, result))
+    db.add_all([db_history for db_history, _ in rows])
+    db.flush()
+    # Captured before the commit expires the recipes
+    indexed = [
+        [
+            recipe_index.IndexedRecipe.from_recipe(link.recipe, recipe.get("ingredients"))
+            for link, recipe in zip(db_history.recipe_links, result["recipes"])
+        ] if db_history.recipe_links else []
+        for db_history, result in rows
+    ]
+    bump_index_version(db, user_id, len(rows))
     db.commit()
-    db.refresh(db_history)
-    return db_history
+    for (db_history, result), entries in zip(rows, indexed):
+        detected = result.get("detected_ingredients") if isinstance(result, dict) else None
+        recipe_index.index.add_history(user_id, db_history.id, detected, entries)
+        for entry in entries:
+            recipe_index.catalog.add(entry)
+    return [db_history for db_history, _ in rows]
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    """Raises ValueError for anything that is not a cursor we issued."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def next_cursor(rows: list, limit: int):
+    # A short page means there is nothing after it
+    return encode_cursor(rows[-1].id) if rows and len(rows) == limit else None
+
+def _with_recipes(query):
+    return query.options(
+        selectinload(models.History.recipe_links)
+        .selectinload(models.HistoryRecipe.recipe)
+        .selectinload(models.Recipe.ingredient_links)
+    )
 
-def get_histories(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.History).filter(models.History.user_id == user_id).order_by(models.History.id.desc()).offset(skip).limit(limit).all()
+def get_recipes(db: Session, recipe_ids: list[int]) -> list:
+    """Recipes in the order of recipe_ids, with their ingredient lines loaded."""
+    rows = db.query(models.Recipe).options(selectinload(models.Recipe.ingredient_links)).filter(models.Recipe.id.in_(recipe_ids))
+    by_id = {recipe.id: recipe for recipe in rows}
+    return [by_id[recipe_id] for recipe_id in recipe_ids if recipe_id in by_id]
+
+def get_histories(db: Session, user_id: int, skip: int = 0, limit: int = 100, before_id: int = None):
+    query = _with_recipes(db.query(models.History)).filter(models.History.user_id == user_id)
+    if before_id is not None:
+        # Keyset pagination: seek straight past the previous page via the (user_id, id) index
+        query = query.filter(models.History.id < before_id)
+    elif skip:
+        query = query.offset(skip)
+    return query.order_by(models.History.id.desc()).limit(limit).all()
+
+def recipe_hash(recipe_data: dict) -> str:
+    # image_path is left out: it is not part of the content and may be filled in later
+    content = {key: recipe_data.get(key) for key in ("name", "ingredients", "instructions")}
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+def get_favorite_by_hash(db: Session, user_id: int, content_hash: str):
+    return db.query(models.Favorite).filter(models.Favorite.user_id == user_id, models.Favorite.recipe_hash == content_hash).first()
+
+def get_history(db: Session, history_id: int, user_id: int):
+    return _with_recipes(db.query(models.History)).filter(models.History.id == history_id, models.History.user_id == user_id).first()
+
+def get_history_summaries(db: Session, user_id: int, limit: int = 100, before_id: int = None):
+    # Only the display columns; analysis_result is never read from disk or serialized
+    query = db.query(
+        models.History.id, models.History.prompt_text, models.History.input_image_path,
+        models.History.input_images, models.History.summary, models.History.created_at,
+    ).filter(models.History.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(models.History.id < before_id)
+    return query.order_by(models.History.id.desc()).limit(limit).all()
 
 def create_favorite(db: Session, favorite: schemas.FavoriteCreate, user_id: int):
-    # Check if already exists? Skipping for mvp
-    db_fav = models.Favorite(user_id=user_id, recipe_data=favorite.recipe_data)
+    recipe_data = favorite.recipe_data or {}
+    content_hash = recipe_hash(recipe_data)
+    existing = get_favorite_by_hash(db, user_id, content_hash)
+    if existing:
+        return existing
+    # recipe_data is client-posted: its image_path is ignored and the favorite
+    # shows whatever image the stored recipe has
+    recipe = get_or_create_recipe(db, recipe_data)
+    db_fav = models.Favorite(
+        user_id=user_id,
+        recipe=recipe,
+        recipe_name=recipe_data.get("name"),
+        recipe_hash=content_hash,
+        summary=favorite_summary({**recipe_data, "image_path": recipe.image_path}),
+    )
     db.add(db_fav)
-    db.commit()
-    db.refresh(db_fav)
+    try:
+        db.flush()
+        indexed = recipe_index.IndexedRecipe.from_recipe(db_fav.recipe, recipe_data.get("ingredients"))
+        bump_index_version(db, user_id)
+        db.commit()
+    except IntegrityError:
+        # Lost a race with an identical concurrent add
+        db.rollback()
+        return get_favorite_by_hash(db, user_id, content_hash)
+    recipe_index.index.add_favorite(user_id, db_fav.id, indexed)
+    # Not added to the shared reuse catalog: favorites are client-posted
     return db_fav
 
-def get_favorites(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Favorite).filter(models.Favorite.user_id == user_id).order_by(models.Favorite.id.desc()).offset(skip).limit(limit).all()
+def _with_favorite_recipe(query):
+    return query.options(selectinload(models.Favorite.recipe).selectinload(models.Recipe.ingredient_links))
+
+def get_favorites(db: Session, user_id: int, skip: int = 0, limit: int = 100, before_id: int = None):
+    query = _with_favorite_recipe(db.query(models.Favorite)).filter(models.Favorite.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(models.Favorite.id < before_id)
+    elif skip:
+        query = query.offset(skip)
+    return query.order_by(models.Favorite.id.desc()).limit(limit).all()
+
+def get_favorite(db: Session, favorite_id: int, user_id: int):
+    return _with_favorite_recipe(db.query(models.Favorite)).filter(models.Favorite.id == favorite_id, models.Favorite.user_id == user_id).first()
+
+def get_favorite_summaries(db: Session, user_id: int, limit: int = 100, before_id: int = None):
+    query = db.query(
+        models.Favorite.id, models.Favorite.recipe_name, models.Favorite.summary, models.Favorite.created_at,
+    ).filter(models.Favorite.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(models.Favorite.id < before_id)
+    return query.order_by(models.Favorite.id.desc()).limit(limit).all()
+
 def delete_favorite_by_id(db: Session, favorite_id: int, user_id: int):
     fav = db.query(models.Favorite).filter(models.Favorite.id == favorite_id, models.Favorite.user_id == user_id).first()
     if fav:
         db.delete(fav)
+        bump_index_version(db, user_id)
         db.commit()
+        recipe_index.index.remove_favorites(user_id, [favorite_id])
         return True
     return False
 
@@ -62,19 +283,21 @@ def delete_history(db: Session, history_id: int, user_id: int):
     history = db.query(models.History).filter(models.History.id == history_id, models.History.user_id == user_id).first()
     if history:
         db.delete(history)
+        bump_index_version(db, user_id)
         db.commit()
+        recipe_index.index.remove_history(user_id, history_id)
         return True
     return False
+
 def delete_favorite(db: Session, favorite_name: str, user_id: int):
-    # This is a bit tricky as we only stored recipe_data json. 
-    # We need to find the favorite by name inside the json structure or if we passed ID.
-    # Since client passes full recipe object to toggle, we might need a better way. 
-    # For now, let's look up all favorites for user and find the one with matching name.
-    # This is inefficient but works for MVP without schema change.
-    favs = db.query(models.Favorite).filter(models.Favorite.user_id == user_id).all()
-    for fav in favs:
-        if fav.recipe_data.get('name') == favorite_name:
-            db.delete(fav)
-            db.commit()
-            return True
-    return False
+    query = db.query(models.Favorite).filter(
+        models.Favorite.user_id == user_id, models.Favorite.recipe_name == favorite_name
+    )
+    favorite_ids = [favorite_id for (favorite_id,) in query.with_entities(models.Favorite.id)]
+    if not favorite_ids:
+        return False
+    query.delete(synchronize_session=False)
+    bump_index_version(db, user_id, len(favorite_ids))
+    db.commit()
+    recipe_index.index.remove_favorites(user_id, favorite_ids)
+    return True
@@ -1,10 +1,14 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 import os
+import time
 from dotenv import load_dotenv
 from urllib.parse import quote_plus
 
+import metrics
+
 load_dotenv()
 
 user = os.getenv("DB_USER", "root")
@@ -15,17 +19,95 @@ db_name = os.getenv("DB_NAME", "cook_ai")
 
 encoded_password = quote_plus(password)
 
-# Fallback to sqlite if connection params are obviously dummy or missing, 
-# but user asked for MariaDB, so we default to that URL structure.
-# If you are running locally without MariaDB, you might want to uncomment the sqlite line for testing.
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{user}:{encoded_password}@{host}:{port}/{db_name}"
-# SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+# mysql (MariaDB, the default), sqlite (a local file) or memory (a throwaway
+# in-process SQLite database for tests and benchmarks). DATABASE_URL, when
+# set, wins over all of these.
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "./sql_app.db")
+
+# Pool settings for mysql and sqlite. MariaDB drops idle connections after
+# wait_timeout; recycle them before that and ping on checkout so a dead
+# connection is replaced instead of failing the request.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+if os.getenv("DATABASE_URL"):
+    SQLALCHEMY_DATABASE_URL = os.environ["DATABASE_URL"]
+elif DB_BACKEND == "memory":
+    SQLALCHEMY_DATABASE_URL = "sqlite://"
+elif DB_BACKEND == "sqlite":
+    SQLALCHEMY_DATABASE_URL = f"sqlite:///{SQLITE_PATH}"
+else:
+    SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{user}:{encoded_password}@{host}:{port}/{db_name}"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
-    # , connect_args={"check_same_thread": False} # Needed for SQLite
+# Apply migrations when a worker starts instead of via `python migrate.py`.
+# Convenient for local SQLite databases (workers take turns through a lock
+# file); keep it off for shared MySQL and run `python migrate.py` before a
+# deploy, so a long step does not hold up every worker's start-up.
+DB_AUTO_MIGRATE = os.getenv(
+    "DB_AUTO_MIGRATE", "true" if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else "false"
+).lower() in ("1", "true", "yes")
+
+CHECKOUT_WAIT = metrics.Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+CHECKOUT_TIMEOUTS = metrics.Counter("db_pool_checkout_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT")
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+def build_engine(url: str):
+    if url.startswith("sqlite"):
+        # Sessions are used from the request threadpool and background workers
+        connect_args = {"check_same_thread": False}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # One shared connection, otherwise every session gets its own empty database
+            return create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+        sqlite_engine = create_engine(
+            url, connect_args=connect_args, poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+        )
+
+        @event.listens_for(sqlite_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            # WAL lets readers proceed while a writer commits
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+        return sqlite_engine
+
+    return create_engine(
+        url, poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+engine = build_engine(SQLALCHEMY_DATABASE_URL)
+# Objects stay loaded after commit, so write paths can return what they
+# just saved without a refresh SELECT. Sessions are request-scoped, so
+# there is no long-lived state to go stale.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+if isinstance(engine.pool, QueuePool):
+    metrics.Gauge("db_pool_checked_out", "Database connections currently in use", callback=engine.pool.checkedout)
+    metrics.Gauge("db_pool_overflow", "Connections opened beyond DB_POOL_SIZE", callback=lambda: max(0, engine.pool.overflow()))
 
 Base = declarative_base()
 
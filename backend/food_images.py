@@ -0,0 +1,310 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import threading
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import database
+import metrics
+import models
+import storage
+import thumbnails
+
+# "inline"     -> /analyze waits (up to IMAGE_FETCH_DEADLINE) for every thumbnail.
+# "background" -> /analyze returns right away; image_path is reserved up front
+#                 and the file shows up once the download finishes.
+IMAGE_FETCH_MODE = os.getenv("IMAGE_FETCH_MODE", "inline")
+IMAGE_FETCH_WORKERS = int(os.getenv("IMAGE_FETCH_WORKERS", 8))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", 5))
+IMAGE_FETCH_DEADLINE = float(os.getenv("IMAGE_FETCH_DEADLINE", 8))
+
+# Image search endpoint; {query} is replaced with the URL-encoded prompt
+IMAGE_SEARCH_URL = os.getenv("IMAGE_SEARCH_URL", "https://tse2.mm.bing.net/th?q={query}&w=800&h=500&c=7&rs=1&p=0")
+
+# One image per dish is kept; least recently used dishes are dropped past either
+# cap, and their files deleted unless a stored recipe still points at them
+FOOD_IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("FOOD_IMAGE_CACHE_MAX_ENTRIES", 5000))
+FOOD_IMAGE_CACHE_MAX_BYTES = int(os.getenv("FOOD_IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Dish -> stored file index; kept outside uploads/ so it is never served
+FOOD_IMAGE_INDEX = os.getenv("FOOD_IMAGE_INDEX", os.path.join(storage.STORAGE_ROOT, "food_images.json"))
+
+# Downloads land here first, then move into storage under uploads/foodImgs/
+SAVE_DIR = os.path.join(storage.STORAGE_ROOT, "uploads", "foodImgs")
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+LOOKUPS = metrics.Counter("food_image_cache_lookups_total", "Recipe image lookups by outcome", ["outcome"])
+
+# One pooled session shared by every request so keep-alive connections to Bing are reused
+_session = None
+_session_lock = threading.Lock()
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_FETCH_WORKERS, thread_name_prefix="food-img")
+
+
+def normalize_query(query: str) -> str:
+    """'Kimchi Fried-Rice' and 'kimchi fried rice' are the same dish."""
+    return " ".join(re.sub(r"[^\w]+", " ", query.lower()).split())
+
+
+def recipe_query(recipe: dict) -> str:
+    return normalize_query(recipe.get("english_name") or recipe["name"])
+
+
+def image_key(query: str) -> str:
+    """Storage key for a dish. Derived from the query so every node and process agrees on it."""
+    return f"uploads/foodImgs/dish-{hashlib.sha256(query.encode()).hexdigest()[:32]}.jpg"
+
+
+def build_image_url(query: str) -> str:
+    # Encode the ENTIRE prompt segment to handle spaces and special chars correctly
+    full_prompt = f"{query} delicious food photorealistic"
+    encoded_prompt = urllib.parse.quote(full_prompt)
+    # Bing Image Search (Thumbnail) by default for instant results:
+    # "c=7" scales the image, "w" and "h" set dimensions.
+    return IMAGE_SEARCH_URL.format(query=encoded_prompt)
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requests is only imported once an image is actually fetched
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=IMAGE_FETCH_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+
+def _download(image_url: str, key: str):
+    """Fetch image_url into storage under key; returns the size in bytes, or None on failure."""
+    try:
+        img_resp = _get_session().get(image_url, timeout=IMAGE_FETCH_TIMEOUT)
+        if img_resp.status_code != 200:
+            print(f"[AI Chef] Failed to download image. Status code: {img_resp.status_code}")
+            return None
+        # Write to a temp name first so a half-written file is never served
+        os.makedirs(SAVE_DIR, exist_ok=True)
+        tmp_path = os.path.join(SAVE_DIR, f"{uuid.uuid4()}.part")
+        with open(tmp_path, "wb") as f:
+            f.write(img_resp.content)
+        file_path = storage.store.put_file(key, tmp_path, "image/jpeg")
+        print(f"[AI Chef] Saved image to {file_path}")
+        return len(img_resp.content)
+    except Exception as e:
+        print(f"[AI Chef] Failed to download image from {image_url}: {e}")
+        return None
+
+
+def _referenced(key: str) -> bool:
+    """Whether a stored recipe (and so some history or favorite) still uses this image.
+
+    Finished analysis jobs are saved to history before they report done, so
+    their results are covered too. Analysis cache entries are not checked
+    (other workers' memory cannot be); refresh_recipe_images re-resolves
+    their images on every hit instead.
+    """
+    db = database.SessionLocal()
+    try:
+        return db.query(models.Recipe.id).filter(models.Recipe.image_path == key).first() is not None
+    finally:
+        db.close()
+
+
+class FoodImageCache:
+    """One stored image per dish, shared by every recipe with that english_name.
+
+    Lookups hit an in-memory LRU index (persisted to FOOD_IMAGE_INDEX), and
+    concurrent misses for the same dish wait on a single download. Files
+    found in storage but missing from the index (fetched by another node,
+    before a restart, or evicted while still referenced) are adopted
+    without going back to Bing.
+    """
+
+    def __init__(self, max_entries: int = FOOD_IMAGE_CACHE_MAX_ENTRIES, max_bytes: int = FOOD_IMAGE_CACHE_MAX_BYTES,
+                 index_path: str = FOOD_IMAGE_INDEX):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_path = index_path
+        self._entries = OrderedDict()  # query -> (key, size), least recently used first
+        self._inflight = {}  # query -> Future
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._loaded = False
+
+    def _load(self):
+        # Called with self._lock held, on first use rather than at import
+        self._loaded = True
+        if not self.index_path:
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[AI Chef] Ignoring unreadable food image index {self.index_path}: {e}")
+            return
+        for query, key, size in rows:
+            if storage.store.name == "local" and not storage.store.exists(key):
+                continue
+            self._entries[query] = (key, size)
+            self.bytes += size
+
+    def _save(self):
+        if not self.index_path:
+            return
+        with self._save_lock:
+            with self._lock:
+                rows = [[query, key, size] for query, (key, size) in self._entries.items()]
+            tmp_path = f"{self.index_path}.part"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(rows, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path)
+            except OSError as e:
+                print(f"[AI Chef] Failed to write food image index: {e}")
+
+    def fetch(self, query: str) -> Future:
+        """A future resolving to the dish's storage key, or None if it could not be fetched."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            entry = self._entries.get(query)
+            if entry is not None:
+                self._entries.move_to_end(query)
+                self.hits += 1
+                LOOKUPS.inc(outcome="hit")
+                future = Future()
+                future.set_result(entry[0])
+                return future
+            future = self._inflight.get(query)
+            if future is not None:
+                self.coalesced += 1
+                LOOKUPS.inc(outcome="coalesced")
+                return future
+            self.misses += 1
+            LOOKUPS.inc(outcome="miss")
+            # Registered under the lock so the download cannot finish before it is visible
+            future = _executor.submit(self._fill, query)
+            self._inflight[query] = future
+            return future
+
+    def _fill(self, query: str):
+        key = image_key(query)
+        try:
+            try:
+                size = storage.store.size(key)
+            except FileNotFoundError:
+                print(f"[AI Chef] Downloading image for {query}")
+                size = _download(build_image_url(query), key)
+                if size is None:
+                    return None
+            self._add(query, key, size)
+            return key
+        except Exception as e:
+            print(f"[AI Chef] Food image lookup failed for {query}: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(query, None)
+
+    def _add(self, query: str, key: str, size: int):
+        evicted = []
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            old = self._entries.pop(query, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[query] = (key, size)
+            self.bytes += size
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, (old_key, old_size) = self._entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._delete(old_key)
+        self._save()
+
+    def _delete(self, key: str):
+        try:
+            if _referenced(key):
+                # Histories and favorites show this file; only the index entry goes
+                return
+            storage.store.delete(key)
+            for size in thumbnails.THUMBNAIL_SIZES:
+                path = thumbnails.thumbnail_path(key, size)
+                if os.path.exists(path):
+                    os.remove(path)
+        except Exception as e:
+            print(f"[AI Chef] Failed to evict food image {key}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "bytes": self.bytes,
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+
+cache = FoodImageCache()
+metrics.Gauge("food_image_cache_bytes", "Bytes of cached recipe images", callback=lambda: cache.bytes)
+
+
+def _submit_all(recipes: list[dict]):
+    jobs = []
+    for recipe in recipes:
+        query = recipe_query(recipe)
+        jobs.append((recipe, query, cache.fetch(query)))
+    return jobs
+
+
+def fetch_recipe_images(recipes: list[dict], deadline: float = IMAGE_FETCH_DEADLINE):
+    """Resolve every recipe thumbnail concurrently and set image_path on the ones that finish before the deadline."""
+    jobs = _submit_all(recipes)
+    wait([future for _, _, future in jobs], timeout=deadline)
+    for recipe, query, future in jobs:
+        if future.done() and future.result():
+            # Store relative path for frontend
+            recipe["image_path"] = future.result()
+        elif not future.done():
+            print(f"[AI Chef] Image download for {recipe['name']} missed the {deadline}s deadline")
+
+
+def schedule_recipe_images(recipes: list[dict]):
+    """Reserve image_path for each recipe and let the downloads finish in the background."""
+    for recipe, query, _ in _submit_all(recipes):
+        recipe["image_path"] = image_key(query)
+
+
+def refresh_recipe_images(result: dict) -> dict:
+    """Point a cached analysis result's recipes at their images again.
+
+    The image cache may have evicted a file since the result was cached;
+    looking it up marks it recently used, or fetches it again.
+    """
+    if isinstance(result.get("recipes"), list):
+        schedule_recipe_images(result["recipes"])
+    return result
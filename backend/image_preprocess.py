@@ -0,0 +1,64 @@
+import os
+import io
+import asyncio
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+# Gemini downsamples large images anyway, so anything past ~1.5k px is wasted upload
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1536))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 85))
+
+# PIL decoding is CPU-bound, keep it off the event loop
+IMAGE_DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", 4))
+_executor = ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS, thread_name_prefix="pil-decode")
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_size: int
+
+    def as_part(self) -> dict:
+        """Inline blob accepted by GenerativeModel.generate_content."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def prepare_image(path: str, max_edge: int = IMAGE_MAX_EDGE, fmt: str = IMAGE_FORMAT, quality: int = IMAGE_QUALITY) -> PreparedImage:
+    # Imported on first use; PIL is a noticeable share of worker start-up
+    import PIL.Image
+    import PIL.ImageOps
+
+    with PIL.Image.open(path) as img:
+        # Phone photos are often stored sideways with an EXIF orientation flag
+        img = PIL.ImageOps.exif_transpose(img)
+        # Convert to RGB to ensure validation and supported format for Gemini
+        img = img.convert('RGB')
+        img.thumbnail((max_edge, max_edge), PIL.Image.LANCZOS)
+
+        buf = io.BytesIO()
+        img.save(buf, format=fmt, quality=quality)
+        return PreparedImage(
+            data=buf.getvalue(),
+            mime_type=MIME_TYPES[fmt],
+            width=img.width,
+            height=img.height,
+            original_size=os.path.getsize(path),
+        )
+
+
+async def prepare_images_async(paths: list[str]) -> list[PreparedImage]:
+    loop = asyncio.get_running_loop()
+    with tracing.span("preprocess"):
+        return await asyncio.gather(*[loop.run_in_executor(_executor, prepare_image, path) for path in paths])
+
+
+def prepare_images(paths: list[str]) -> list[PreparedImage]:
+    return list(_executor.map(prepare_image, paths))
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from dataclasses import dataclass, field, asdict
+
+import metrics
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", 50))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", 60 * 60))
+# Unfinished jobs untouched for this long are assumed orphaned by a dead process and re-queued
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 10 * 60))
+# "memory" keeps jobs in this process only; "sqlite" persists them to JOB_QUEUE_PATH
+# so queued work survives a restart and status can be read by every worker on the host
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory")
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db"))
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    user_id: int
+    payload: dict
+    status: str = "queued"   # queued -> running -> done | failed
+    stage: str = "queued"    # finer-grained progress reported by the handler
+    result: dict = None
+    error: str = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def public(self) -> dict:
+        data = asdict(self)
+        del data["payload"]
+        return data
+
+
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def save(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self, stale_before: float) -> list[Job]:
+        return []
+
+    def prune(self, older_than: float):
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.status in TERMINAL_STATUSES and j.updated_at < older_than]:
+                del self._jobs[job_id]
+
+
+class SqliteJobStore:
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, kind TEXT, user_id INTEGER, payload TEXT,
+                status TEXT, stage TEXT, result TEXT, error TEXT,
+                created_at REAL, updated_at REAL
+            )"""
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _from_row(row) -> Job:
+        return Job(
+            id=row[0], kind=row[1], user_id=row[2], payload=json.loads(row[3]),
+            status=row[4], stage=row[5], result=json.loads(row[6]) if row[6] else None,
+            error=row[7], created_at=row[8], updated_at=row[9],
+        )
+
+    def save(self, job: Job):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.id, job.kind, job.user_id, json.dumps(job.payload, ensure_ascii=False),
+             job.status, job.stage, json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+             job.error, job.created_at, job.updated_at),
+        )
+
+    def get(self, job_id: str):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def pending(self, stale_before: float) -> list[Job]:
+        rows = self._conn().execute(
+            "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND updated_at < ? ORDER BY created_at",
+            (stale_before,),
+        ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def prune(self, older_than: float):
+        self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (older_than,)
+        )
+
+
+class JobQueue:
+    """Bounded in-process worker pool for long-running requests.
+
+    Handlers are registered per job kind and receive (job, report) where
+    report(stage) publishes progress. Job payloads must be JSON-serialisable
+    so the sqlite store can re-queue unfinished work after a restart.
+    """
+
+    def __init__(self, store, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_DEPTH):
+        self.store = store
+        self.workers = workers
+        self.max_depth = max_depth
+        self.handlers = {}
+        self._queue = None
+        self._tasks = []
+        self._changed = {}   # job_id -> Event set on the next update made by this process
+        self._waiting = {}   # job_id -> number of wait_for_change calls using that Event
+
+    def register(self, kind: str, handler):
+        self.handlers[kind] = handler
+
+    def _ensure_started(self):
+        # Workers are bound to the running loop, so start them on first use
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        for job in self.store.pending(time.time() - JOB_STALE_AFTER):
+            try:
+                self._queue.put_nowait(job)
+                self._update(job, status="queued", stage="queued")
+            except asyncio.QueueFull:
+                self._update(job, status="failed", stage="failed", error="Dropped on restart: job queue is full")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, kind: str, user_id: int, payload: dict) -> Job:
+        self._ensure_started()
+        job = Job(id=uuid.uuid4().hex, kind=kind, user_id=user_id, payload=payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"Job queue is full ({self.max_depth} waiting)")
+        self.store.save(job)
+        return job
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def _update(self, job: Job, **changes):
+        for key, value in changes.items():
+            setattr(job, key, value)
+        job.updated_at = time.time()
+        self.store.save(job)
+        event = self._changed.pop(job.id, None)
+        if event is not None:
+            event.set()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                self._update(job, status="running", stage="running")
+                result = await self.handlers[job.kind](job, lambda stage: self._update(job, stage=stage))
+                self._update(job, status="done", stage="done", result=result)
+            except Exception as e:
+                print(f"[Jobs] Job {job.id} failed: {e}")
+                self._update(job, status="failed", stage="failed", error=getattr(e, "detail", str(e)))
+            finally:
+                self._queue.task_done()
+                self.store.prune(time.time() - JOB_RESULT_TTL)
+
+    async def wait_for_change(self, job_id: str, timeout: float = 1.0):
+        # Status written by another process is picked up by the timeout re-poll
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        self._waiting[job_id] = self._waiting.get(job_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Drop the Event with its last waiter, so jobs finished by another
+            # worker or watched by a client that went away do not leave it behind
+            self._waiting[job_id] -= 1
+            if not self._waiting[job_id]:
+                del self._waiting[job_id]
+                if self._changed.get(job_id) is event:
+                    del self._changed[job_id]
+
+    async def events(self, job_id: str):
+        """Yield the job's public state every time it changes until it finishes."""
+        last = None
+        while True:
+            job = self.store.get(job_id)
+            if job is None:
+                return
+            state = job.public()
+            if (state["status"], state["stage"]) != last:
+                last = (state["status"], state["stage"])
+                yield state
+            if job.status in TERMINAL_STATUSES:
+                return
+            await self.wait_for_change(job_id)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_depth": self.max_depth,
+        }
+
+
+queue = JobQueue(SqliteJobStore() if JOB_QUEUE_BACKEND == "sqlite" else MemoryJobStore())
+metrics.Gauge("job_queue_depth", "Jobs waiting for a worker", callback=lambda: queue.stats()["queued"])
@@ -1,19 +1,41 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form
+import time
+_import_started = time.perf_counter()  # start-up time is reported from here
+
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import timedelta
-import shutil
-import os
-import uuid
+from typing import Optional
+from contextlib import asynccontextmanager
 import json
+import asyncio
+
+import schemas, crud, auth, ai_agent, batch_analysis, database, uploads, jobs, metrics, rate_limiter, recipe_index, recipe_reuse, static_files, storage, thumbnails, tracing
 
-import models, schemas, crud, auth, ai_agent, database
+def preload_gemini():
+    try:
+        ai_agent.get_model()
+    except Exception as e:
+        # The first Gemini call retries and reports the error properly
+        print(f"[AI Chef] Gemini client preload failed: {e}")
 
-models.Base.metadata.create_all(bind=database.engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Importing this module has no side effects; schema changes and client
+    # set-up happen here, once the server is actually starting
+    if database.DB_AUTO_MIGRATE:
+        import migrate
+        await run_in_threadpool(migrate.upgrade)
+    # Warm the Gemini client in the background so the first /analyze does not pay for the SDK import
+    asyncio.get_running_loop().run_in_executor(None, preload_gemini)
+    print(f"[AI Chef] Worker ready {time.perf_counter() - _import_started:.2f}s after importing main")
+    yield
+    database.engine.dispose()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 origins = [
@@ -27,26 +49,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Use absolute path for uploads directory
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+UPLOAD_DIR = uploads.UPLOAD_DIR
 
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+if storage.store.name == "local":
+    # Uploads are write-once, so responses carry a content-hash ETag and may be cached forever
+    app.mount("/uploads", static_files.CachedStaticFiles(directory=UPLOAD_DIR), name="uploads")
+else:
+    @app.get("/uploads/{key:path}")
+    def redirect_upload(key: str):
+        # Old links and stored image_path values keep working; the bytes come from the bucket
+        return RedirectResponse(storage.store.url(f"uploads/{key}"), status_code=302, headers={"Cache-Control": "public, max-age=86400"})
 
-# Dependency
-def get_db():
-    db = database.SessionLocal()
+# Multipart framing adds a little on top of the raw file bytes
+UPLOAD_REQUEST_OVERHEAD = 64 * 1024
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Refuse obviously oversized bodies before the multipart parser spools them
+    content_length = request.headers.get("content-length")
+    if request.method == "POST" and content_length and content_length.isdigit():
+        if int(content_length) > uploads.UPLOAD_MAX_REQUEST_BYTES + UPLOAD_REQUEST_OVERHEAD:
+            return JSONResponse(status_code=413, content={"detail": "Request body too large"})
+    return await call_next(request)
+
+@app.exception_handler(rate_limiter.LimiterBusy)
+async def gemini_busy_handler(request: Request, exc: rate_limiter.LimiterBusy):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics(request: Request):
+    # Cache, queue and user counts are not for the public internet
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics.authorized(request.headers.get("authorization")):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return metrics.render()
+
+@app.get("/thumbs/{size}/{path:path}")
+async def read_thumbnail(size: int, path: str, request: Request):
+    # path is the stored relative path, e.g. /thumbs/320/uploads/<sha256>.jpg
     try:
-        yield db
-    finally:
-        db.close()
+        thumb = await run_in_threadpool(thumbnails.ensure_thumbnail, path, size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except OSError:
+        raise HTTPException(status_code=422, detail="Image could not be decoded")
+    return await run_in_threadpool(static_files.cached_file_response, thumb, request.headers)
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+    user = await run_in_threadpool(crud.get_user_by_username, db, username=form_data.username)
+    if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -59,7 +121,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/signup", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
     db_user = crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
@@ -70,98 +132,375 @@ async def read_users_me(current_user: schemas.User = Depends(auth.get_current_us
     return current_user
 
 @app.put("/users/me", response_model=schemas.User)
-def update_user(user_update: schemas.UserUpdate, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def update_user(user_update: schemas.UserUpdate, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
     # Verify current password if password update is requested
+    hashed_password = None
     if user_update.password:
         if not user_update.current_password:
              raise HTTPException(status_code=400, detail="Current password is required to change password")
-        if not auth.verify_password(user_update.current_password, current_user.hashed_password):
+        if not await auth.verify_password_async(user_update.current_password, current_user.hashed_password):
             raise HTTPException(status_code=400, detail="Incorrect current password")
-            
-    return crud.update_user_profile(db, current_user.id, user_update)
+        # Hashed on the bcrypt pool without holding a threadpool thread
+        hashed_password = await auth.get_password_hash_async(user_update.password)
+
+    return await run_in_threadpool(crud.update_user_profile, db, current_user.id, user_update, hashed_password)
+
+def history_create(prompt: str, relative_paths: list[str], result: dict) -> schemas.HistoryCreate:
+    return schemas.HistoryCreate(
+        prompt_text=prompt,
+        # Comma-joined copy for clients that have not moved to input_images yet
+        input_image_path=",".join(relative_paths),
+        input_images=[storage.ref(key) for key in relative_paths],
+        analysis_result=result
+    )
+
+def save_history(db: Session, user_id: int, prompt: str, relative_paths: list[str], result: dict):
+    return crud.create_history(db, history_create(prompt, relative_paths, result), user_id)
+
+def save_history_detached(user_id: int, prompt: str, relative_paths: list[str], result: dict):
+    # For work that outlives the request (jobs, streamed responses) and so
+    # cannot use the request-scoped session
+    db = database.SessionLocal()
+    try:
+        save_history(db, user_id, prompt, relative_paths, result)
+    finally:
+        db.close()
+
+def save_histories_detached(user_id: int, entries: list[tuple]) -> list[int]:
+    # entries are (prompt, relative_paths, result); all rows go in with one commit
+    db = database.SessionLocal()
+    try:
+        histories = crud.create_histories(db, [history_create(*entry) for entry in entries], user_id)
+        return [history.id for history in histories]
+    finally:
+        db.close()
+
+async def run_analysis_job(job: jobs.Job, report):
+    payload = job.payload
+    with tracing.trace("analyze_job"):
+        report("analyzing")
+        if payload.get("reuse"):
+            result = await recipe_reuse.analyze_with_reuse(payload["image_paths"], payload["prompt"], payload.get("ingredients"))
+        else:
+            result = await ai_agent.analyze_fridge_image_async(payload["image_paths"], payload["prompt"])
+        if "error" in result:
+            raise HTTPException(status_code=500, detail=result["error"])
+
+        report("saving")
+        with tracing.span("save_history"):
+            await run_in_threadpool(save_history_detached, job.user_id, payload["prompt"], payload["relative_paths"], result)
+        return result
+
+jobs.queue.register("analyze", run_analysis_job)
+
+async def ingest_analyze_uploads(files: list[UploadFile]):
+    saved_paths = []
+    relative_paths = []
+    budget = uploads.UploadBudget()
+
+    with tracing.span("upload"):
+        for file in files:
+            stored = await uploads.ingest_upload(file, budget)
+            saved_paths.append(stored.path)
+            relative_paths.append(stored.relative_path)
+            if not stored.deduplicated:
+                thumbnails.schedule(stored.relative_path, stored.path)
+    return saved_paths, relative_paths
+
+def parse_ingredients(ingredients: str) -> list[str]:
+    # Comma separated, e.g. "달걀,시금치,양파"
+    return [name.strip() for name in ingredients.split(",") if name.strip()]
 
 @app.post("/analyze")
 async def analyze_fridge(
     files: list[UploadFile] = File(...), 
     prompt: str = Form(""), 
+    background: bool = Form(False),
+    reuse: bool = Form(False),
+    ingredients: str = Form(""),
     current_user: schemas.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(database.get_db)
 ):
-    saved_paths = []
-    relative_paths = []
-    
-    for file in files:
-        file_extension = file.filename.split(".")[-1]
-        file_name = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, file_name)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        saved_paths.append(file_path)
-        relative_paths.append(f"uploads/{file_name}")
-        
-    # AI Analysis
-    result = ai_agent.analyze_fridge_image(saved_paths, prompt)
-    
-    if "error" in result:
-        raise HTTPException(status_code=500, detail=result["error"])
-
-    # Save history - join multiple paths with comma
-    combined_relative_path = ",".join(relative_paths)
-    
-    history_in = schemas.HistoryCreate(
-        prompt_text=prompt,
-        input_image_path=combined_relative_path,
-        analysis_result=result
-    )
-    crud.create_history(db, history_in, current_user.id)
-    
-    return result
+    if background:
+        saved_paths, relative_paths = await ingest_analyze_uploads(files)
+        # Hand off to the worker pool and let the client poll /jobs/{id}
+        try:
+            job = jobs.queue.submit("analyze", current_user.id, {
+                "image_paths": saved_paths,
+                "relative_paths": relative_paths,
+                "prompt": prompt,
+                "reuse": reuse,
+                "ingredients": parse_ingredients(ingredients),
+            })
+        except jobs.QueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+        return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+    with tracing.trace("analyze"):
+        saved_paths, relative_paths = await ingest_analyze_uploads(files)
+
+        # AI Analysis; reuse mode answers from stored recipes when the ingredients
+        # match and no prompt asks for something specific
+        if reuse:
+            result = await recipe_reuse.analyze_with_reuse(saved_paths, prompt, parse_ingredients(ingredients))
+        else:
+            result = await ai_agent.analyze_fridge_image_async(saved_paths, prompt)
+
+        if "error" in result:
+            raise HTTPException(status_code=500, detail=result["error"])
+
+        with tracing.span("save_history"):
+            await run_in_threadpool(save_history, db, current_user.id, prompt, relative_paths, result)
+
+        return result
+
+@app.post("/analyze/stream")
+async def analyze_fridge_stream(
+    files: list[UploadFile] = File(...), 
+    prompt: str = Form(""), 
+    reuse: bool = Form(False),
+    ingredients: str = Form(""),
+    current_user: schemas.User = Depends(auth.get_current_user)
+):
+    # Finished by the response body, which outlives this function
+    trace = tracing.Trace("analyze_stream")
+    with tracing.activate(trace):
+        try:
+            saved_paths, relative_paths = await ingest_analyze_uploads(files)
+            # Looked up before the response starts so a busy limiter can still answer 429
+            reused = await recipe_reuse.try_reuse(saved_paths, parse_ingredients(ingredients), prompt) if reuse else None
+        except Exception:
+            trace.finish("error")
+            raise
+
+    user_id = current_user.id
+
+    async def reused_events(result: dict):
+        yield "detected_ingredients", result["detected_ingredients"]
+        for recipe in result["recipes"]:
+            yield "recipe", recipe
+        yield "done", result
+
+    async def event_stream():
+        # One JSON object per line: detected_ingredients, recipe (repeated), then done or error
+        outcome = "error"
+        with tracing.activate(trace):
+            try:
+                events = reused_events(reused) if reused else ai_agent.stream_fridge_analysis(saved_paths, prompt)
+                async for kind, value in events:
+                    if kind == "done":
+                        outcome = "ok"
+                        with tracing.span("save_history"):
+                            await run_in_threadpool(save_history_detached, user_id, prompt, relative_paths, value)
+                    yield json.dumps({"type": kind, "data": value}, ensure_ascii=False) + "\n"
+            finally:
+                trace.finish(outcome)
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+def parse_batch_items(items: str) -> list[schemas.BatchAnalyzeItem]:
+    try:
+        parsed = [schemas.BatchAnalyzeItem.model_validate(item) for item in json.loads(items)]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid items: {e}")
+    if not 1 <= len(parsed) <= batch_analysis.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch takes 1 to {batch_analysis.BATCH_MAX_ITEMS} items")
+    return parsed
+
+def history_images(db: Session, history_id: int, user_id: int):
+    """(prompt, local paths, storage keys) of a saved history, for re-running it."""
+    history = crud.get_history(db, history_id, user_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"History {history_id} not found")
+    refs = history.input_images if history.input_images is not None else storage.legacy_refs(history.input_image_path)
+    keys = [ref["key"] for ref in refs]
+    try:
+        return history.prompt_text or "", [storage.store.local_path(key) for key in keys], keys
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Images of history {history_id} are no longer stored")
+
+@app.post("/analyze/batch")
+async def analyze_fridge_batch(
+    items: str = Form(...),
+    files: list[UploadFile] = File([]),
+    current_user: schemas.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    # items is a JSON list like [{"files": [0, 1], "prompt": "한식"}, {"history_id": 12, "prompt": "2개"}]
+    requested = parse_batch_items(items)
+    trace = tracing.Trace("analyze_batch")
+    with tracing.activate(trace):
+        try:
+            saved_paths, relative_paths = await ingest_analyze_uploads(files)
+            batch = []
+            sources = {}  # index -> (prompt, relative_paths) for saving
+            for index, item in enumerate(requested):
+                if item.history_id is not None:
+                    prompt, paths, keys = await run_in_threadpool(history_images, db, item.history_id, current_user.id)
+                else:
+                    prompt, paths, keys = "", [], []
+                if any(not 0 <= i < len(saved_paths) for i in item.files):
+                    raise HTTPException(status_code=400, detail=f"Item {index} refers to a file that was not uploaded")
+                paths += [saved_paths[i] for i in item.files]
+                keys += [relative_paths[i] for i in item.files]
+                if not paths:
+                    raise HTTPException(status_code=400, detail=f"Item {index} has no images")
+                prompt = item.prompt if item.prompt is not None else prompt
+                batch.append(batch_analysis.BatchItem(index=index, prompt=prompt, image_paths=paths))
+                sources[index] = (prompt, keys)
+        except Exception:
+            trace.finish("error")
+            raise
+
+    user_id = current_user.id
+
+    async def save(unsaved: list[tuple]):
+        entries = [(*sources[index], result) for index, result in unsaved]
+        with tracing.span("save_history"):
+            ids = await run_in_threadpool(save_histories_detached, user_id, entries)
+        saved = [{"index": index, "history_id": history_id} for (index, _), history_id in zip(unsaved, ids)]
+        unsaved.clear()
+        return json.dumps({"type": "saved", "data": saved}) + "\n"
+
+    async def event_stream():
+        # One JSON object per line: result / error per item (in completion order),
+        # saved after every BATCH_SAVE_SIZE results, then done
+        outcome = "error"
+        counts = {"ok": 0, "error": 0}
+        unsaved = []
+        with tracing.activate(trace):
+            try:
+                async for index, result in batch_analysis.analyze_batch(batch):
+                    if "error" in result:
+                        counts["error"] += 1
+                        yield json.dumps({"type": "error", "index": index, "data": result["error"]}, ensure_ascii=False) + "\n"
+                        continue
+                    counts["ok"] += 1
+                    yield json.dumps({"type": "result", "index": index, "data": result}, ensure_ascii=False) + "\n"
+                    unsaved.append((index, result))
+                    if len(unsaved) >= batch_analysis.BATCH_SAVE_SIZE:
+                        yield await save(unsaved)
+                if unsaved:
+                    yield await save(unsaved)
+                outcome = "ok" if counts["ok"] else "error"
+                yield json.dumps({"type": "done", "data": counts}) + "\n"
+            finally:
+                trace.finish(outcome)
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+def get_user_job(job_id: str, current_user: schemas.User):
+    job = jobs.queue.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+def read_job(job_id: str, current_user: schemas.User = Depends(auth.get_current_user)):
+    return get_user_job(job_id, current_user).public()
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, current_user: schemas.User = Depends(auth.get_current_user)):
+    get_user_job(job_id, current_user)
+
+    async def event_stream():
+        async for state in jobs.queue.events(job_id):
+            yield f"event: {state['status']}\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def parse_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return crud.decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/history/summary", response_model=list[schemas.HistorySummary])
+def read_history_summary(response: Response, limit: int = 100, cursor: Optional[str] = None, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
+    rows = crud.get_history_summaries(db, current_user.id, limit=limit, before_id=parse_cursor(cursor))
+    if next_cursor := crud.next_cursor(rows, limit):
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@app.get("/history/{history_id}", response_model=schemas.History)
+def read_history_item(history_id: int, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
+    history = crud.get_history(db, history_id, current_user.id)
+    if history is None:
+        raise HTTPException(status_code=404, detail="History not found")
+    return history
 
 @app.get("/history", response_model=list[schemas.History])
-def read_history(skip: int = 0, limit: int = 100, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    return crud.get_histories(db, current_user.id, skip=skip, limit=limit)
+def read_history(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
+    rows = crud.get_histories(db, current_user.id, skip=skip, limit=limit, before_id=parse_cursor(cursor))
+    if next_cursor := crud.next_cursor(rows, limit):
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 @app.post("/favorites", response_model=schemas.Favorite)
-def add_favorite(favorite: schemas.FavoriteCreate, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+def add_favorite(favorite: schemas.FavoriteCreate, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
     return crud.create_favorite(db, favorite, current_user.id)
 
 @app.get("/favorites", response_model=list[schemas.Favorite])
-def read_favorites(skip: int = 0, limit: int = 100, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    return crud.get_favorites(db, current_user.id, skip=skip, limit=limit)
+def read_favorites(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
+    rows = crud.get_favorites(db, current_user.id, skip=skip, limit=limit, before_id=parse_cursor(cursor))
+    if next_cursor := crud.next_cursor(rows, limit):
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@app.get("/favorites/summary", response_model=list[schemas.FavoriteSummary])
+def read_favorite_summary(response: Response, limit: int = 100, cursor: Optional[str] = None, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
+    rows = crud.get_favorite_summaries(db, current_user.id, limit=limit, before_id=parse_cursor(cursor))
+    if next_cursor := crud.next_cursor(rows, limit):
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@app.get("/recipes/search", response_model=schemas.RecipeSearchResult)
+def search_recipes(ingredients: str, limit: int = 20, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
+    # ingredients is comma separated, e.g. ?ingredients=달걀,시금치
+    names = [name for name in ingredients.split(",") if name.strip()]
+    if not names:
+        raise HTTPException(status_code=400, detail="ingredients is required")
+    return recipe_index.index.search(db, current_user.id, names, limit=max(1, min(limit, 100)))
+
+@app.get("/favorites/id/{favorite_id}", response_model=schemas.Favorite)
+def read_favorite(favorite_id: int, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
+    favorite = crud.get_favorite(db, favorite_id, current_user.id)
+    if favorite is None:
+        raise HTTPException(status_code=404, detail="Favorite not found")
+    return favorite
 
 @app.delete("/favorites/{recipe_name}")
-def delete_favorite(recipe_name: str, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+def delete_favorite(recipe_name: str, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
     success = crud.delete_favorite(db, recipe_name, current_user.id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Favorite not found")
+    return {"message": "Deleted successfully"}
+
 @app.post("/users/me/image", response_model=schemas.User)
 async def upload_user_image(
     file: UploadFile = File(...), 
     current_user: schemas.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(database.get_db)
 ):
-    file_extension = file.filename.split(".")[-1]
-    file_name = f"profile_{current_user.id}_{uuid.uuid4()}.{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, file_name)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    stored = await uploads.ingest_upload(file)
+    if not stored.deduplicated:
+        thumbnails.schedule(stored.relative_path, stored.path)
         
-    # Update user profile
-    # URL relative to backend base
-    relative_path = f"http://localhost:8000/uploads/{file_name}"
-    user_update = schemas.UserUpdate(profile_image=relative_path)
-    return crud.update_user_profile(db, current_user.id, user_update)
+    # Update user profile; the key is stored and turned into a URL on read
+    user_update = schemas.UserUpdate(profile_image=stored.relative_path)
+    return await run_in_threadpool(crud.update_user_profile, db, current_user.id, user_update)
 
 @app.delete("/history/{history_id}")
-def delete_history(history_id: int, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+def delete_history(history_id: int, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
     success = crud.delete_history(db, history_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="History not found")
     return {"message": "Deleted successfully"}
 
 @app.delete("/favorites/id/{favorite_id}")
-def delete_favorite_by_id(favorite_id: int, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+def delete_favorite_by_id(favorite_id: int, current_user: schemas.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db)):
     success = crud.delete_favorite_by_id(db, favorite_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Favorite not found")
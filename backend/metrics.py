@@ -0,0 +1,124 @@
+import os
+import hmac
+import threading
+
+# Minimal in-process metrics registry rendered in the Prometheus text format.
+# Values are per worker process; scrape each worker or aggregate upstream.
+
+# /metrics answers only requests with "Authorization: Bearer <token>";
+# left empty, the endpoint is off (404)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+_registry = []
+_lock = threading.Lock()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_str(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels: dict):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_label_str(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames=(), callback=None):
+        # callback() is evaluated at scrape time, for values owned by another object
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        if self.callback is not None:
+            return [f"{self.name} {self.callback()}"]
+        return [f"{self.name}{_label_str(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (1 if value <= b else 0) for c, b in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            for bound, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, ('le', bound))} {c}")
+            lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {count}")
+        return lines
+
+
+def authorized(authorization: str) -> bool:
+    """Whether an Authorization header carries METRICS_TOKEN."""
+    scheme, _, token = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode())
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,579 @@
+"""Create and upgrade the database schema.
+
+Usage (from backend/):
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied and pending migrations
+
+Run it before starting the app; app workers do not touch the schema
+(except with DB_AUTO_MIGRATE, on by default for the sqlite and memory
+backends). It uses the same settings as the app (DATABASE_URL /
+DB_BACKEND, see database.py).
+
+Missing tables are created from the models first. On a database that had
+no tables at all the steps below are then only recorded, since the new
+tables are already current; otherwise each pending step runs once and is
+recorded in schema_migrations. Steps check the live schema before
+changing it, so databases patched by hand or by the old fix_db_schema.py
+upgrade cleanly. Workers starting together with DB_AUTO_MIGRATE take
+turns: upgrade() holds a lock shared by every process on the database
+(GET_LOCK on MySQL, a lock file next to a SQLite file), so the first
+one migrates and the rest find nothing pending.
+"""
+import os
+import sys
+import time
+import argparse
+from contextlib import contextmanager
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import engine
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("name", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+def fix_schema():
+    inspector = inspect(engine)
+    
+    # Check if users table exists
+    if not inspector.has_table("users"):
+        print("users table does not exist. It is created from the models.")
+        return
+
+    columns = [col['name'] for col in inspector.get_columns("users")]
+    
+    with engine.connect() as conn:
+        # 1. Add created_at
+        if "created_at" not in columns:
+            print("Adding created_at column...")
+            try:
+                conn.execute(text("ALTER TABLE users ADD COLUMN created_at TIMESTAMP NOT NULL DEFAULT current_timestamp()"))
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding created_at: {e}")
+
+        # 2. Add email
+        if "email" not in columns:
+            print("Adding email column...")
+            try:
+                conn.execute(text("ALTER TABLE users ADD COLUMN email VARCHAR(255) DEFAULT NULL"))
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding email: {e}")
+
+        # 3. Add password (plain)
+        if "password" not in columns:
+            print("Adding password column...")
+            try:
+                conn.execute(text("ALTER TABLE users ADD COLUMN password VARCHAR(255) DEFAULT NULL"))
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding password: {e}")
+
+        # 4. Add updated_at
+        if "updated_at" not in columns:
+            print("Adding updated_at column...")
+            try:
+                conn.execute(text("ALTER TABLE users ADD COLUMN updated_at VARCHAR(100) DEFAULT NULL"))
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding updated_at: {e}")
+
+        # 5. Add kling_ai_access_key
+        if "kling_ai_access_key" not in columns:
+            print("Adding kling_ai_access_key column...")
+            try:
+                conn.execute(text("ALTER TABLE users ADD COLUMN kling_ai_access_key VARCHAR(255) DEFAULT NULL"))
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding kling_ai_access_key: {e}")
+        
+        # 6. Add kling_ai_secret_key
+        if "kling_ai_secret_key" not in columns:
+            print("Adding kling_ai_secret_key column...")
+            try:
+                conn.execute(text("ALTER TABLE users ADD COLUMN kling_ai_secret_key VARCHAR(255) DEFAULT NULL"))
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding kling_ai_secret_key: {e}")
+        
+        # 7. Add deapi_api_key
+        if "deapi_api_key" not in columns:
+            print("Adding deapi_api_key column...")
+            try:
+                conn.execute(text("ALTER TABLE users ADD COLUMN deapi_api_key VARCHAR(255) DEFAULT NULL"))
+                conn.commit()
+            except Exception as e:
+                print(f"Error adding deapi_api_key: {e}")
+
+        # 8. Modify hashed_password length
+        print("Modifying hashed_password length to 255...")
+        try:
+            conn.execute(text("ALTER TABLE users MODIFY COLUMN hashed_password VARCHAR(255) NOT NULL"))
+            conn.commit()
+        except Exception as e:
+            print(f"Error modifying hashed_password: {e}")
+
+        # 9. Modify profile_image length
+        print("Modifying profile_image length to 500...")
+        try:
+            conn.execute(text("ALTER TABLE users MODIFY COLUMN profile_image VARCHAR(500) DEFAULT NULL"))
+            conn.commit()
+        except Exception as e:
+            print(f"Error modifying profile_image: {e}")
+            
+    print("Schema fix completed.")
+
+def fix_favorites(batch_size: int = 1000):
+    inspector = inspect(engine)
+    if not inspector.has_table("favorites"):
+        print("favorites table does not exist. It is created from the models.")
+        return
+
+    columns = [col['name'] for col in inspector.get_columns("favorites")]
+    indexes = [idx['name'] for idx in inspector.get_indexes("favorites")]
+
+    with engine.connect() as conn:
+        # 1. Add recipe_name / recipe_hash
+        if "recipe_name" not in columns:
+            print("Adding recipe_name column...")
+            conn.execute(text("ALTER TABLE favorites ADD COLUMN recipe_name VARCHAR(255) DEFAULT NULL"))
+            conn.commit()
+        if "recipe_hash" not in columns:
+            print("Adding recipe_hash column...")
+            conn.execute(text("ALTER TABLE favorites ADD COLUMN recipe_hash VARCHAR(64) DEFAULT NULL"))
+            conn.commit()
+
+        # 2. Backfill from recipe_data in batches
+        import json
+        from crud import recipe_hash
+        print("Backfilling recipe_name / recipe_hash...")
+        last_id = 0
+        filled = 0
+        while True:
+            rows = conn.execute(
+                text("SELECT id, recipe_data FROM favorites WHERE id > :last_id AND recipe_hash IS NULL ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size},
+            ).fetchall()
+            if not rows:
+                break
+            for fav_id, recipe_data in rows:
+                if isinstance(recipe_data, str):
+                    recipe_data = json.loads(recipe_data)
+                recipe_data = recipe_data or {}
+                conn.execute(
+                    text("UPDATE favorites SET recipe_name = :name, recipe_hash = :hash WHERE id = :id"),
+                    {"name": recipe_data.get("name"), "hash": recipe_hash(recipe_data), "id": fav_id},
+                )
+            conn.commit()
+            filled += len(rows)
+            last_id = rows[-1][0]
+        print(f"Backfilled {filled} favorites.")
+
+        # 3. Drop duplicate favorites (keep the oldest) so the unique key can be added
+        duplicates = conn.execute(text(
+            "SELECT f.id FROM favorites f JOIN favorites o "
+            "ON o.user_id = f.user_id AND o.recipe_hash = f.recipe_hash AND o.id < f.id"
+        )).fetchall()
+        if duplicates:
+            print(f"Removing {len(duplicates)} duplicate favorites...")
+            for (fav_id,) in duplicates:
+                conn.execute(text("DELETE FROM favorites WHERE id = :id"), {"id": fav_id})
+            conn.commit()
+
+        # 4. Indexes
+        if "ix_favorites_user_name" not in indexes:
+            print("Adding ix_favorites_user_name index...")
+            conn.execute(text("CREATE INDEX ix_favorites_user_name ON favorites (user_id, recipe_name)"))
+            conn.commit()
+        if "uq_favorites_user_hash" not in indexes:
+            print("Adding uq_favorites_user_hash unique key...")
+            conn.execute(text("CREATE UNIQUE INDEX uq_favorites_user_hash ON favorites (user_id, recipe_hash)"))
+            conn.commit()
+
+    print("Favorites migration completed.")
+
+def fix_pagination_indexes():
+    # (user_id, id) lets keyset pagination seek directly to the next page
+    inspector = inspect(engine)
+    with engine.connect() as conn:
+        for table, index in (("histories", "ix_histories_user_id_id"), ("favorites", "ix_favorites_user_id_id")):
+            if not inspector.has_table(table):
+                continue
+            if index not in [idx['name'] for idx in inspector.get_indexes(table)]:
+                print(f"Adding {index} index...")
+                try:
+                    conn.execute(text(f"CREATE INDEX {index} ON {table} (user_id, id)"))
+                    conn.commit()
+                except Exception as e:
+                    print(f"Error adding {index}: {e}")
+
+def fix_list_summaries(batch_size: int = 1000):
+    import json
+    from crud import history_summary, favorite_summary
+
+    inspector = inspect(engine)
+    targets = (
+        ("histories", "analysis_result", history_summary),
+        ("favorites", "recipe_data", favorite_summary),
+    )
+    with engine.connect() as conn:
+        for table, source, build in targets:
+            if not inspector.has_table(table):
+                continue
+            columns = [col['name'] for col in inspector.get_columns(table)]
+            if "summary" not in columns:
+                print(f"Adding {table}.summary column...")
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN summary JSON DEFAULT NULL"))
+                conn.commit()
+            if "created_at" not in columns:
+                print(f"Adding {table}.created_at column...")
+                if engine.dialect.name == "sqlite":
+                    # SQLite cannot add a column with a non-constant default, so fill existing rows instead
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN created_at TIMESTAMP NULL"))
+                    conn.execute(text(f"UPDATE {table} SET created_at = CURRENT_TIMESTAMP"))
+                else:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN created_at TIMESTAMP NULL DEFAULT current_timestamp()"))
+                conn.commit()
+
+            print(f"Backfilling {table}.summary...")
+            last_id = 0
+            filled = 0
+            while True:
+                rows = conn.execute(
+                    text(f"SELECT id, {source} FROM {table} WHERE id > :last_id AND summary IS NULL ORDER BY id LIMIT :limit"),
+                    {"last_id": last_id, "limit": batch_size},
+                ).fetchall()
+                if not rows:
+                    break
+                for row_id, data in rows:
+                    if isinstance(data, str):
+                        data = json.loads(data)
+                    conn.execute(
+                        text(f"UPDATE {table} SET summary = :summary WHERE id = :id"),
+                        {"summary": json.dumps(build(data or {}), ensure_ascii=False), "id": row_id},
+                    )
+                conn.commit()
+                filled += len(rows)
+                last_id = rows[-1][0]
+            print(f"Backfilled {filled} {table} rows.")
+
+def _json_bytes(conn, table: str, column: str) -> int:
+    return conn.execute(text(f"SELECT COALESCE(SUM(LENGTH({column})), 0) FROM {table}")).scalar() or 0
+
+def _store_recipe(conn, recipe_data: dict) -> int:
+    """get_or_create_recipe for the migration, with explicit columns; returns the recipe id."""
+    from crud import food_image_key, recipe_hash
+    from recipe_index import normalize_ingredient
+
+    content_hash = recipe_hash(recipe_data)
+    image_path = food_image_key(recipe_data.get("image_path"))
+    row = conn.execute(text("SELECT id, image_path FROM recipes WHERE content_hash = :hash"), {"hash": content_hash}).first()
+    if row is not None:
+        if not row[1] and image_path:
+            conn.execute(text("UPDATE recipes SET image_path = :image_path WHERE id = :id"), {"image_path": image_path, "id": row[0]})
+        return row[0]
+
+    conn.execute(
+        text("INSERT INTO recipes (name, english_name, details, image_path, content_hash) "
+             "VALUES (:name, :english_name, :details, :image_path, :hash)"),
+        {
+            "name": (recipe_data.get("name") or "")[:255],
+            "english_name": (recipe_data.get("english_name") or "")[:255] or None,
+            "details": recipe_data.get("instructions"),
+            "image_path": image_path,
+            "hash": content_hash,
+        },
+    )
+    recipe_id = conn.execute(text("SELECT id FROM recipes WHERE content_hash = :hash"), {"hash": content_hash}).scalar()
+    for position, line in enumerate(str(line) for line in recipe_data.get("ingredients") or []):
+        ingredient_id = None
+        name = normalize_ingredient(line)
+        if name:
+            ingredient_id = conn.execute(text("SELECT id FROM ingredients WHERE name = :name"), {"name": name}).scalar()
+            if ingredient_id is None:
+                conn.execute(text("INSERT INTO ingredients (name) VALUES (:name)"), {"name": name})
+                ingredient_id = conn.execute(text("SELECT id FROM ingredients WHERE name = :name"), {"name": name}).scalar()
+        conn.execute(
+            text("INSERT INTO recipe_ingredients (recipe_id, position, ingredient_id, text) VALUES (:recipe_id, :position, :ingredient_id, :text)"),
+            {"recipe_id": recipe_id, "position": position, "ingredient_id": ingredient_id, "text": line[:255]},
+        )
+    return recipe_id
+
+def fix_recipe_store(batch_size: int = 200):
+    """Move recipes out of histories/favorites JSON into the shared recipe tables."""
+    import json
+    import models
+
+    inspector = inspect(engine)
+    if not inspector.has_table("histories") and not inspector.has_table("favorites"):
+        print("histories/favorites tables do not exist. They are created from the models.")
+        return
+
+    # 1. New tables, and the recipes table if it was never created
+    models.Base.metadata.create_all(bind=engine, tables=[
+        models.Recipe.__table__, models.Ingredient.__table__,
+        models.RecipeIngredient.__table__, models.HistoryRecipe.__table__,
+    ])
+
+    recipe_columns = [col['name'] for col in inspect(engine).get_columns("recipes")]
+    favorite_columns = [col['name'] for col in inspector.get_columns("favorites")]
+    with engine.connect() as conn:
+        for column, ddl in (
+            ("english_name", "ALTER TABLE recipes ADD COLUMN english_name VARCHAR(255) DEFAULT NULL"),
+            ("image_path", "ALTER TABLE recipes ADD COLUMN image_path VARCHAR(500) DEFAULT NULL"),
+            ("content_hash", "ALTER TABLE recipes ADD COLUMN content_hash VARCHAR(64) DEFAULT NULL"),
+        ):
+            if column not in recipe_columns:
+                print(f"Adding recipes.{column} column...")
+                conn.execute(text(ddl))
+                conn.commit()
+                if column == "content_hash":
+                    conn.execute(text("CREATE UNIQUE INDEX uq_recipes_content_hash ON recipes (content_hash)"))
+                    conn.commit()
+        try:
+            conn.execute(text("ALTER TABLE recipes MODIFY COLUMN name VARCHAR(255)"))
+            conn.commit()
+        except Exception as e:
+            print(f"Error modifying recipes.name: {e}")
+        if "recipe_id" not in favorite_columns:
+            print("Adding favorites.recipe_id column...")
+            conn.execute(text("ALTER TABLE favorites ADD COLUMN recipe_id INTEGER DEFAULT NULL REFERENCES recipes(id)"))
+            conn.commit()
+
+        before = _json_bytes(conn, "histories", "analysis_result") + _json_bytes(conn, "favorites", "recipe_data")
+
+    # 2. Convert rows in id batches. Reads and writes name their columns, so
+    # the step keeps working as the models gain columns later.
+    converted_histories = 0
+    converted_favorites = 0
+    with engine.connect() as conn:
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                text("SELECT id, analysis_result FROM histories WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size},
+            ).fetchall()
+            if not rows:
+                break
+            for history_id, result in rows:
+                if isinstance(result, str):
+                    result = json.loads(result)
+                if not isinstance(result, dict) or not isinstance(result.get("recipes"), list):
+                    continue
+                if conn.execute(text("SELECT 1 FROM history_recipes WHERE history_id = :id LIMIT 1"), {"id": history_id}).first():
+                    continue
+                for position, recipe in enumerate(result["recipes"]):
+                    conn.execute(
+                        text("INSERT INTO history_recipes (history_id, position, recipe_id) VALUES (:history_id, :position, :recipe_id)"),
+                        {"history_id": history_id, "position": position, "recipe_id": _store_recipe(conn, recipe)},
+                    )
+                conn.execute(
+                    text("UPDATE histories SET analysis_result = :result WHERE id = :id"),
+                    {"result": json.dumps({key: value for key, value in result.items() if key != "recipes"}, ensure_ascii=False), "id": history_id},
+                )
+                converted_histories += 1
+            conn.commit()
+            last_id = rows[-1][0]
+
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                text("SELECT id, recipe_id, recipe_data FROM favorites WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size},
+            ).fetchall()
+            if not rows:
+                break
+            for favorite_id, recipe_id, data in rows:
+                if isinstance(data, str):
+                    data = json.loads(data)
+                if recipe_id is not None or not isinstance(data, dict):
+                    continue
+                conn.execute(
+                    text("UPDATE favorites SET recipe_id = :recipe_id, recipe_data = NULL WHERE id = :id"),
+                    {"recipe_id": _store_recipe(conn, data), "id": favorite_id},
+                )
+                converted_favorites += 1
+            conn.commit()
+            last_id = rows[-1][0]
+
+    with engine.connect() as conn:
+        after = _json_bytes(conn, "histories", "analysis_result") + _json_bytes(conn, "favorites", "recipe_data")
+        recipes = conn.execute(text("SELECT COUNT(*) FROM recipes")).scalar()
+    print(f"Converted {converted_histories} histories and {converted_favorites} favorites into {recipes} stored recipes.")
+    print(f"Inline recipe JSON: {before} -> {after} bytes.")
+
+def fix_image_refs(batch_size: int = 1000):
+    """Add histories.input_images and fill it from the comma-joined input_image_path."""
+    import json
+    from storage import legacy_refs
+
+    inspector = inspect(engine)
+    if not inspector.has_table("histories"):
+        return
+    columns = [col['name'] for col in inspector.get_columns("histories")]
+    with engine.connect() as conn:
+        if "input_images" not in columns:
+            print("Adding histories.input_images column...")
+            conn.execute(text("ALTER TABLE histories ADD COLUMN input_images JSON DEFAULT NULL"))
+            conn.commit()
+
+        print("Backfilling histories.input_images...")
+        last_id = 0
+        filled = 0
+        while True:
+            rows = conn.execute(
+                text("SELECT id, input_image_path FROM histories WHERE id > :last_id AND input_images IS NULL ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size},
+            ).fetchall()
+            if not rows:
+                break
+            for row_id, paths in rows:
+                conn.execute(
+                    text("UPDATE histories SET input_images = :refs WHERE id = :id"),
+                    {"refs": json.dumps(legacy_refs(paths)), "id": row_id},
+                )
+            conn.commit()
+            filled += len(rows)
+            last_id = rows[-1][0]
+        print(f"Backfilled {filled} histories rows.")
+
+def fix_image_path_length():
+    """Widen histories.input_image_path; four or more content-addressed keys overflow VARCHAR(255)."""
+    inspector = inspect(engine)
+    if not inspector.has_table("histories"):
+        return
+    if engine.dialect.name == "sqlite":
+        # SQLite does not enforce VARCHAR lengths
+        return
+    with engine.connect() as conn:
+        print("Changing histories.input_image_path to TEXT...")
+        conn.execute(text("ALTER TABLE histories MODIFY COLUMN input_image_path TEXT NULL"))
+        conn.commit()
+
+def fix_recipe_image_index():
+    """Index recipes.image_path; the food image cache checks it before deleting an evicted image."""
+    inspector = inspect(engine)
+    if not inspector.has_table("recipes"):
+        return
+    if "ix_recipes_image_path" in [idx['name'] for idx in inspector.get_indexes("recipes")]:
+        return
+    with engine.connect() as conn:
+        print("Adding ix_recipes_image_path index...")
+        conn.execute(text("CREATE INDEX ix_recipes_image_path ON recipes (image_path)"))
+        conn.commit()
+
+def fix_user_index_version():
+    """Add users.index_version, the per-user change counter the recipe index checks for freshness."""
+    inspector = inspect(engine)
+    if "index_version" in [col['name'] for col in inspector.get_columns("users")]:
+        return
+    with engine.connect() as conn:
+        print("Adding users.index_version column...")
+        conn.execute(text("ALTER TABLE users ADD COLUMN index_version INTEGER NOT NULL DEFAULT 0"))
+        conn.commit()
+
+# Applied in order; append new steps at the end and never rename old ones.
+# A step runs against the schema as the previous steps left it, so read and
+# write only the columns it needs with SQL; ORM queries on models select
+# every mapped column, including ones later steps add (0005 broke on
+# histories.input_images from 0006 that way).
+MIGRATIONS = [
+    ("0001_users_columns", fix_schema),
+    ("0002_favorites_hash", fix_favorites),
+    ("0003_pagination_indexes", fix_pagination_indexes),
+    ("0004_list_summaries", fix_list_summaries),
+    ("0005_recipe_store", fix_recipe_store),
+    ("0006_image_refs", fix_image_refs),
+    ("0007_image_path_text", fix_image_path_length),
+    ("0008_recipe_image_index", fix_recipe_image_index),
+    ("0009_user_index_version", fix_user_index_version),
+]
+
+def applied_migrations() -> set:
+    _meta.create_all(bind=engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(select(schema_migrations.c.name))}
+
+def _record(name: str):
+    try:
+        with engine.begin() as conn:
+            conn.execute(schema_migrations.insert().values(name=name))
+    except IntegrityError:
+        # Recorded by a process that did not take the lock (e.g. no fcntl)
+        print(f"[Migrate] {name} was already recorded")
+
+# Seconds to wait for another process's migration to finish
+MIGRATE_LOCK_TIMEOUT = 600
+
+@contextmanager
+def _migration_lock():
+    """Hold a lock shared by every process using the database."""
+    if engine.dialect.name == "mysql":
+        with engine.connect() as conn:
+            if not conn.execute(text("SELECT GET_LOCK('schema_migrations', :timeout)"), {"timeout": MIGRATE_LOCK_TIMEOUT}).scalar():
+                raise RuntimeError("Timed out waiting for another process's migration")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK('schema_migrations')"))
+        return
+    path = engine.url.database
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if engine.dialect.name != "sqlite" or not path or path == ":memory:" or fcntl is None:
+        # In-memory databases belong to one process
+        yield
+        return
+    with open(f"{os.path.abspath(path)}.migrate.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def upgrade() -> list[str]:
+    """Bring the schema up to date; returns the names of the steps that ran."""
+    with _migration_lock():
+        fresh = not inspect(engine).has_table("users")
+        models.Base.metadata.create_all(bind=engine)
+        done = applied_migrations()
+        ran = []
+        for name, step in MIGRATIONS:
+            if name in done:
+                continue
+            if not fresh:
+                print(f"[Migrate] Running {name}...")
+                start = time.perf_counter()
+                step()
+                print(f"[Migrate] {name} done in {time.perf_counter() - start:.1f}s")
+                ran.append(name)
+            _record(name)
+        return ran
+
+def status():
+    done = applied_migrations()
+    for name, _ in MIGRATIONS:
+        print(f"{'applied' if name in done else 'pending'}  {name}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    args = parser.parse_args()
+    if args.status:
+        status()
+        sys.exit(0)
+    try:
+        ran = upgrade()
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        sys.exit(1)
+    print(f"Schema is up to date ({len(ran)} step(s) applied).")
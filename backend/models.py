@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, JSON, TIMESTAMP
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, JSON, TIMESTAMP, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -18,34 +18,133 @@ class User(Base):
     kling_ai_access_key = Column(String(255), nullable=True)
     kling_ai_secret_key = Column(String(255), nullable=True)
     deapi_api_key = Column(String(255), nullable=True)
+    # Bumped with every history/favorite change so each worker's recipe index
+    # can tell, with one lookup, whether another worker changed them
+    index_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     histories = relationship("History", back_populates="user")
     favorites = relationship("Favorite", back_populates="user")
 
+    # Fetch created_at as part of the INSERT (RETURNING where supported) instead of on first access
+    __mapper_args__ = {"eager_defaults": True}
+
 class History(Base):
     __tablename__ = "histories"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    input_image_path = Column(String(255), nullable=True)
+    # Legacy comma-joined paths, still written for older clients; Text because
+    # several content-addressed keys (~76 chars each) overflow VARCHAR(255)
+    input_image_path = Column(Text, nullable=True)
+    # [{"store": "local" | "s3", "key": "uploads/<sha256>.jpg"}, ...]; URLs are resolved per response
+    input_images = Column(JSON, nullable=True)
     prompt_text = Column(Text, nullable=True)
-    analysis_result = Column(JSON, nullable=True) # or Text
+    # Everything except the recipes, which live in history_recipes.
+    # Rows written before the recipe store still carry their recipes inline.
+    stored_result = Column("analysis_result", JSON, nullable=True)
+    # Small display-only projection of analysis_result for list views
+    summary = Column(JSON, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now(), nullable=True)
     
     user = relationship("User", back_populates="histories")
+    recipe_links = relationship("HistoryRecipe", order_by="HistoryRecipe.position", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_histories_user_id_id", "user_id", "id"),
+    )
+
+    @property
+    def analysis_result(self):
+        result = self.stored_result
+        if not isinstance(result, dict):
+            return result
+        if not self.recipe_links:
+            # Rows from before the recipe store keep their inline recipes; clients
+            # expect "recipes" to be present, so a history without any gets []
+            return {"recipes": [], **result}
+        return {**result, "recipes": [link.recipe.to_dict() for link in self.recipe_links]}
+
+    @analysis_result.setter
+    def analysis_result(self, value):
+        self.stored_result = value
+
+class Ingredient(Base):
+    __tablename__ = "ingredients"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Normalized name without quantities, e.g. "달걀" for "달걀 2개"
+    name = Column(String(255), unique=True, nullable=False)
 
 class Recipe(Base):
     __tablename__ = "recipes"
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), index=True)
-    details = Column(Text)
-    ingredients = Column(Text)
+    name = Column(String(255), index=True)
+    english_name = Column(String(255), nullable=True)
+    details = Column(Text) # cooking instructions
+    # Indexed so the food image cache can tell whether a dish image is still referenced
+    image_path = Column(String(500), nullable=True, index=True)
+    # Hash of name + ingredients + instructions; identical generated recipes share one row
+    content_hash = Column(String(64), unique=True, nullable=True)
+
+    ingredient_links = relationship("RecipeIngredient", order_by="RecipeIngredient.position", cascade="all, delete-orphan")
+
+    def to_dict(self) -> dict:
+        data = {
+            "recipe_id": self.id,
+            "name": self.name,
+            "english_name": self.english_name,
+            "ingredients": [link.text for link in self.ingredient_links],
+            "instructions": self.details,
+        }
+        if self.image_path:
+            data["image_path"] = self.image_path
+        return data
+
+class RecipeIngredient(Base):
+    __tablename__ = "recipe_ingredients"
+
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    ingredient_id = Column(Integer, ForeignKey("ingredients.id"), nullable=True, index=True)
+    text = Column(String(255)) # original line with the amount, e.g. "달걀 2개"
+
+    ingredient = relationship("Ingredient")
+
+class HistoryRecipe(Base):
+    __tablename__ = "history_recipes"
+
+    history_id = Column(Integer, ForeignKey("histories.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), index=True)
+
+    recipe = relationship("Recipe")
 
 class Favorite(Base):
     __tablename__ = "favorites"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    recipe_data = Column(JSON) # Storing full recipe snapshot for simplicity
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=True)
+    # Full recipe snapshot; only set on rows written before the recipe store
+    stored_recipe_data = Column("recipe_data", JSON, nullable=True)
+    # Denormalized from recipe_data so lookups and dedup don't have to scan JSON
+    recipe_name = Column(String(255), nullable=True)
+    recipe_hash = Column(String(64), nullable=True)
+    summary = Column(JSON, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now(), nullable=True)
     
     user = relationship("User", back_populates="favorites")
+    recipe = relationship("Recipe")
+
+    __table_args__ = (
+        Index("ix_favorites_user_name", "user_id", "recipe_name"),
+        Index("ix_favorites_user_id_id", "user_id", "id"),
+        UniqueConstraint("user_id", "recipe_hash", name="uq_favorites_user_hash"),
+    )
+
+    @property
+    def recipe_data(self):
+        if self.recipe is not None:
+            return self.recipe.to_dict()
+        return self.stored_recipe_data
@@ -0,0 +1,167 @@
+import os
+import re
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+
+import metrics
+import tracing
+
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 60))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", 5))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+# Callers allowed to wait for a slot before new ones are turned away
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", 32))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", 2))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", 60))
+
+REQUESTS = metrics.Counter("gemini_requests_total", "Gemini calls by outcome", ["outcome"])
+RETRIES = metrics.Counter("gemini_retries_total", "Gemini calls retried after a rate limit")
+REJECTED = metrics.Counter("gemini_rejected_total", "Calls turned away because the limiter queue was full")
+INFLIGHT = metrics.Gauge("gemini_inflight", "Gemini calls currently running")
+WAITING = metrics.Gauge("gemini_waiting", "Callers waiting for a Gemini slot")
+WAIT_SECONDS = metrics.Histogram("gemini_limiter_wait_seconds", "Time spent waiting for a Gemini slot")
+
+_RETRY_HINT_PATTERNS = [
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+    re.compile(r"retry-after:?\s*([\d.]+)", re.IGNORECASE),
+]
+
+
+class LimiterBusy(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gemini is at capacity, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    if getattr(e, "code", None) == 429:
+        return True
+    error_str = str(e).lower()
+    return "429" in error_str or "quota" in error_str or "rate limit" in error_str or "resource exhausted" in error_str
+
+
+def retry_hint(e: Exception):
+    """Seconds the server asked us to wait, if the error says so."""
+    text = str(e)
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """Token bucket whose refill rate backs off on 429s and creeps back up on success (AIMD)."""
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # Waiters queue on the lock so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def slow_down(self):
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        # Drop the saved-up burst so everyone does not resume at once
+        self.tokens = min(self.tokens, 0)
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class GeminiLimiter:
+    """Process-wide gate in front of every Gemini call.
+
+    slot() enforces, in order: the waiting-room size (fail fast with
+    LimiterBusy), the concurrency cap, any shared cooldown set by a recent
+    429, and the token bucket. A 429 pauses every caller until the server's
+    retry hint has passed instead of each request backing off on its own.
+    """
+
+    def __init__(self, rpm: float = GEMINI_RPM, burst: int = GEMINI_BURST, max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 max_queue: int = GEMINI_MAX_QUEUE, max_retries: int = GEMINI_MAX_RETRIES):
+        self.bucket = TokenBucket(rpm / 60, burst)
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._cooldown_until = 0.0
+        metrics.Gauge("gemini_limiter_rate", "Current token bucket refill rate (calls/s)", callback=lambda: self.bucket.rate)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._waiting >= self.max_queue:
+            REJECTED.inc()
+            raise LimiterBusy(max(self._cooldown_until - time.monotonic(), 1 / self.bucket.rate))
+
+        self._waiting += 1
+        WAITING.set(self._waiting)
+        start = time.monotonic()
+        try:
+            await self._semaphore.acquire()
+            try:
+                while (remaining := self._cooldown_until - time.monotonic()) > 0:
+                    await asyncio.sleep(remaining)
+                await self.bucket.acquire()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self._waiting -= 1
+            WAITING.set(self._waiting)
+        waited = time.monotonic() - start
+        WAIT_SECONDS.observe(waited)
+        tracing.record("gemini_wait", waited)
+
+        INFLIGHT.inc()
+        try:
+            yield
+        finally:
+            INFLIGHT.dec()
+            self._semaphore.release()
+
+    def record_success(self):
+        REQUESTS.inc(outcome="ok")
+        self.bucket.speed_up()
+
+    def record_failure(self):
+        REQUESTS.inc(outcome="error")
+
+    def record_rate_limited(self, e: Exception, attempt: int) -> float:
+        """Note a 429 and return how long this caller should wait before retrying."""
+        REQUESTS.inc(outcome="rate_limited")
+        RETRIES.inc()
+        self.bucket.slow_down()
+        hint = retry_hint(e)
+        if hint is not None:
+            delay = hint + random.uniform(0, 1)
+        else:
+            # Full jitter keeps retries from landing in lockstep
+            delay = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + (hint if hint is not None else delay))
+        return delay
+
+
+gemini = GeminiLimiter()
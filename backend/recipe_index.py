@@ -0,0 +1,501 @@
+"""In-process inverted index from ingredients to a user's recipes and histories.
+
+Answers "what have I already cooked with eggs and spinach" without
+loading /history and /favorites. A user's index is built from the
+database on their first search and then kept current by crud
+(create/delete of histories and favorites). Each process has its own
+copy, so with several workers a user's index is built once per worker.
+Writes made by other workers are not seen directly: crud bumps
+users.index_version with every change, and before each search the index
+compares that one column with the changes it has applied and rebuilds
+on a mismatch, or after RECIPE_INDEX_TTL.
+"""
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+import metrics
+import models
+
+# How many users' indexes stay in memory; least recently searched go first
+RECIPE_INDEX_MAX_USERS = int(os.getenv("RECIPE_INDEX_MAX_USERS", 1000))
+# Rebuild an index at least this often; backstop for changes the version
+# checks cannot see (e.g. a write that bypassed crud)
+RECIPE_INDEX_TTL = float(os.getenv("RECIPE_INDEX_TTL", 10 * 60))
+
+# Words that only describe an amount, dropped when normalizing ingredient names
+_QUANTITY_WORDS = {"약간", "적당량", "조금", "소량", "한줌", "some", "a", "pinch", "of", "to", "taste"}
+
+def normalize_ingredient(text: str) -> str:
+    """Reduce an ingredient line to its name: "달걀 2개" -> "달걀", "Olive oil (2 tbsp)" -> "olive oil"."""
+    text = re.sub(r"\(.*?\)", " ", str(text))
+    # The amount starts at the first number
+    text = re.split(r"[0-9½¼¾⅓⅔]", text, maxsplit=1)[0]
+    words = [w for w in re.split(r"[\s,/:]+", text.lower()) if w and w not in _QUANTITY_WORDS]
+    return " ".join(words)[:255]
+
+def ingredient_terms(lines) -> frozenset:
+    return frozenset(t for t in map(normalize_ingredient, lines or []) if t)
+
+
+@dataclass
+class IndexedRecipe:
+    recipe_id: int
+    name: Optional[str]
+    english_name: Optional[str]
+    image_path: Optional[str]
+    terms: frozenset
+    history_ids: set = field(default_factory=set)
+    favorite_ids: set = field(default_factory=set)
+
+    @classmethod
+    def from_recipe(cls, recipe: models.Recipe, lines: list) -> "IndexedRecipe":
+        """Build from a recipe that was just stored, without touching its relationships."""
+        return cls(recipe.id, recipe.name, recipe.english_name, recipe.image_path, ingredient_terms(lines))
+
+
+class _Postings:
+    """term -> bitmask of slots, one slot per indexed key.
+
+    Slots are handed out in insertion order, so a higher bit is a newer
+    entry. Python ints make union/intersection over 100k entries a few
+    microseconds, where counting over sets of ids took >100 ms.
+    """
+    def __init__(self):
+        self.keys = []      # slot -> key (None once removed)
+        self.slot_of = {}   # key -> slot
+        self.terms = {}     # key -> terms
+        self.masks = {}     # term -> bitmask of slots
+
+    def __contains__(self, key):
+        return key in self.slot_of
+
+    def add(self, key, terms: frozenset):
+        slot = len(self.keys)
+        self.keys.append(key)
+        self.slot_of[key] = slot
+        self.terms[key] = terms
+        bit = 1 << slot
+        for term in terms:
+            self.masks[term] = self.masks.get(term, 0) | bit
+
+    def remove(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is None:
+            return
+        self.keys[slot] = None
+        clear = ~(1 << slot)
+        for term in self.terms.pop(key):
+            mask = self.masks[term] & clear
+            if mask:
+                self.masks[term] = mask
+            else:
+                del self.masks[term]
+        if len(self.keys) > 1024 and len(self.slot_of) < len(self.keys) // 2:
+            self._compact()
+
+    def _compact(self):
+        live = [(key, self.terms[key]) for key in self.keys if key is not None]
+        self.__init__()
+        for key, terms in live:
+            self.add(key, terms)
+
+    def top(self, terms: set, limit: int) -> list[tuple]:
+        """(match count, key) for the best limit keys, newest first within a count."""
+        masks = [self.masks[t] for t in terms if t in self.masks]
+        if not masks:
+            return []
+        # Bit-sliced counter: counter[j] holds bit j of every slot's match count
+        counter = []
+        for carry in masks:
+            for j in range(len(counter)):
+                counter[j], carry = counter[j] ^ carry, counter[j] & carry
+                if not carry:
+                    break
+            if carry:
+                counter.append(carry)
+        matched_any = 0
+        for mask in masks:
+            matched_any |= mask
+
+        results = []
+        for score in range(len(masks), 0, -1):
+            if score.bit_length() > len(counter):
+                continue  # nobody matched that many
+            level = matched_any
+            for j, bits in enumerate(counter):
+                level &= bits if score >> j & 1 else ~bits
+            while level and len(results) < limit:
+                slot = level.bit_length() - 1
+                results.append((score, self.keys[slot]))
+                level ^= 1 << slot
+            if len(results) >= limit:
+                break
+        return results
+
+
+class _UserIndex:
+    def __init__(self):
+        self.recipes = {}              # recipe_id -> IndexedRecipe
+        self.recipe_postings = _Postings()
+        self.histories = {}            # history_id -> recipe ids
+        self.history_postings = _Postings()
+        self.favorites = {}            # favorite_id -> recipe_id
+        self.loaded_at = time.monotonic()
+        # users.index_version this index matches; the add/remove methods
+        # return True when they changed something, and each of those counts
+        self.version = 0
+
+    def _link(self, entry: IndexedRecipe, history_id: int = None, favorite_id: int = None):
+        current = self.recipes.get(entry.recipe_id)
+        if current is None:
+            current = self.recipes[entry.recipe_id] = entry
+            self.recipe_postings.add(entry.recipe_id, entry.terms)
+        if history_id is not None:
+            current.history_ids.add(history_id)
+        if favorite_id is not None:
+            current.favorite_ids.add(favorite_id)
+
+    def _unlink(self, recipe_id: int, history_id: int = None, favorite_id: int = None):
+        entry = self.recipes.get(recipe_id)
+        if entry is None:
+            return
+        entry.history_ids.discard(history_id)
+        entry.favorite_ids.discard(favorite_id)
+        if not entry.history_ids and not entry.favorite_ids:
+            del self.recipes[recipe_id]
+            self.recipe_postings.remove(recipe_id)
+
+    def add_history(self, history_id: int, detected: frozenset, recipes: list) -> bool:
+        if history_id in self.histories:
+            return False
+        self.histories[history_id] = [r.recipe_id for r in recipes]
+        self.history_postings.add(history_id, detected)
+        for entry in recipes:
+            self._link(entry, history_id=history_id)
+        return True
+
+    def remove_history(self, history_id: int) -> bool:
+        if history_id not in self.histories:
+            return False
+        self.history_postings.remove(history_id)
+        for recipe_id in self.histories.pop(history_id):
+            self._unlink(recipe_id, history_id=history_id)
+        return True
+
+    def add_favorite(self, favorite_id: int, entry: IndexedRecipe) -> bool:
+        if favorite_id in self.favorites:
+            return False
+        self.favorites[favorite_id] = entry.recipe_id
+        self._link(entry, favorite_id=favorite_id)
+        return True
+
+    def remove_favorite(self, favorite_id: int) -> bool:
+        recipe_id = self.favorites.pop(favorite_id, None)
+        if recipe_id is None:
+            return False
+        self._unlink(recipe_id, favorite_id=favorite_id)
+        return True
+
+    def apply(self, op: str, args: tuple):
+        if getattr(self, op)(*args):
+            self.version += 1
+
+
+def _index_version(db: Session, user_id: int) -> int:
+    return db.query(models.User.index_version).filter(models.User.id == user_id).scalar() or 0
+
+
+def _load_user(db: Session, user_id: int) -> _UserIndex:
+    """Build a user's index with a handful of column-only queries."""
+    # Read before the rows: a change committed in between makes the index
+    # look older than it is (one extra rebuild), never newer
+    version = _index_version(db, user_id)
+    history_recipe_ids = (
+        select(models.HistoryRecipe.recipe_id)
+        .join(models.History, models.History.id == models.HistoryRecipe.history_id)
+        .where(models.History.user_id == user_id)
+    )
+    favorite_recipe_ids = select(models.Favorite.recipe_id).where(models.Favorite.user_id == user_id)
+    owned = or_(models.Recipe.id.in_(history_recipe_ids), models.Recipe.id.in_(favorite_recipe_ids))
+
+    terms = {}
+    term_rows = (
+        db.query(models.RecipeIngredient.recipe_id, models.Ingredient.name)
+        .join(models.Ingredient, models.Ingredient.id == models.RecipeIngredient.ingredient_id)
+        .join(models.Recipe, models.Recipe.id == models.RecipeIngredient.recipe_id)
+        .filter(owned)
+    )
+    for recipe_id, name in term_rows:
+        terms.setdefault(recipe_id, set()).add(name)
+
+    recipes = {
+        recipe_id: (recipe_id, name, english_name, image_path)
+        for recipe_id, name, english_name, image_path in db.query(
+            models.Recipe.id, models.Recipe.name, models.Recipe.english_name, models.Recipe.image_path
+        ).filter(owned)
+    }
+
+    def entry(recipe_id: int) -> IndexedRecipe:
+        return IndexedRecipe(*recipes[recipe_id], frozenset(terms.get(recipe_id, ())))
+
+    history_recipes = {}
+    link_rows = (
+        db.query(models.HistoryRecipe.history_id, models.HistoryRecipe.recipe_id)
+        .join(models.History, models.History.id == models.HistoryRecipe.history_id)
+        .filter(models.History.user_id == user_id)
+        .order_by(models.HistoryRecipe.history_id, models.HistoryRecipe.position)
+    )
+    for history_id, recipe_id in link_rows:
+        history_recipes.setdefault(history_id, []).append(recipe_id)
+
+    user_index = _UserIndex()
+    user_index.version = version
+    history_rows = (
+        db.query(models.History.id, models.History.stored_result)
+        .filter(models.History.user_id == user_id)
+        .order_by(models.History.id)
+    )
+    for history_id, result in history_rows:
+        detected = result.get("detected_ingredients") if isinstance(result, dict) else None
+        user_index.add_history(
+            history_id,
+            ingredient_terms(detected),
+            [entry(recipe_id) for recipe_id in history_recipes.get(history_id, []) if recipe_id in recipes],
+        )
+    favorite_rows = db.query(models.Favorite.id, models.Favorite.recipe_id).filter(
+        models.Favorite.user_id == user_id, models.Favorite.recipe_id.isnot(None)
+    ).order_by(models.Favorite.id)
+    for favorite_id, recipe_id in favorite_rows:
+        if recipe_id in recipes:
+            user_index.add_favorite(favorite_id, entry(recipe_id))
+    return user_index
+
+
+class _PendingLoad:
+    def __init__(self):
+        self.ops = []  # changes that arrived while the load was running
+        self.done = threading.Event()
+
+
+class RecipeIndex:
+    def __init__(self, max_users: int = RECIPE_INDEX_MAX_USERS, ttl: float = RECIPE_INDEX_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()  # user_id -> _UserIndex
+        self._loading = {}           # user_id -> _PendingLoad
+        self._lock = threading.Lock()
+
+    def _apply(self, user_id: int, op: str, *args):
+        with self._lock:
+            pending = self._loading.get(user_id)
+            if pending is not None:
+                pending.ops.append((op, args))
+                return
+            user_index = self._users.get(user_id)
+            # Users that are not loaded pick the change up from the database later
+            if user_index is not None:
+                user_index.apply(op, args)
+
+    def add_history(self, user_id: int, history_id: int, detected, recipes: list[IndexedRecipe]):
+        self._apply(user_id, "add_history", history_id, ingredient_terms(detected), recipes)
+
+    def remove_history(self, user_id: int, history_id: int):
+        self._apply(user_id, "remove_history", history_id)
+
+    def add_favorite(self, user_id: int, favorite_id: int, entry: IndexedRecipe):
+        self._apply(user_id, "add_favorite", favorite_id, entry)
+
+    def remove_favorites(self, user_id: int, favorite_ids):
+        for favorite_id in favorite_ids:
+            self._apply(user_id, "remove_favorite", favorite_id)
+
+    def forget_user(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def _drop_if_stale(self, db: Session, user_id: int):
+        """Forget the user's index if another worker changed their histories or favorites."""
+        with self._lock:
+            user_index = self._users.get(user_id)
+            if user_index is None:
+                return
+            expired = time.monotonic() - user_index.loaded_at > self.ttl
+            indexed = user_index.version
+        if not expired and _index_version(db, user_id) == indexed:
+            return
+        with self._lock:
+            # Only drop the copy that was checked; a fresh reload may have replaced it meanwhile
+            if self._users.get(user_id) is user_index:
+                del self._users[user_id]
+
+    def _ensure_loaded(self, db: Session, user_id: int):
+        self._drop_if_stale(db, user_id)
+        self._load(db, user_id)
+
+    def _load(self, db: Session, user_id: int):
+        with self._lock:
+            if user_id in self._users:
+                self._users.move_to_end(user_id)
+                return
+            pending = self._loading.get(user_id)
+            owner = pending is None
+            if owner:
+                pending = self._loading[user_id] = _PendingLoad()
+        if not owner:
+            pending.done.wait()
+            # The other loader failed; try ourselves
+            return self._load(db, user_id)
+
+        try:
+            user_index = _load_user(db, user_id)
+        except Exception:
+            with self._lock:
+                del self._loading[user_id]
+            pending.done.set()
+            raise
+        with self._lock:
+            # Changes the load already saw are no-ops and do not count
+            for op, args in pending.ops:
+                user_index.apply(op, args)
+            del self._loading[user_id]
+            self._users[user_id] = user_index
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        pending.done.set()
+
+    def search(self, db: Session, user_id: int, ingredients: list[str], limit: int = 20) -> dict:
+        """Rank the user's recipes and histories by how many of the ingredients they share.
+
+        Ties go to the most recently indexed recipe / history.
+        """
+        terms = {t for t in map(normalize_ingredient, ingredients) if t}
+        self._ensure_loaded(db, user_id)
+        with self._lock:
+            user_index = self._users.get(user_id)
+            if user_index is None or not terms:
+                return {"ingredients": sorted(terms), "recipes": [], "histories": []}
+
+            recipes = []
+            for score, recipe_id in user_index.recipe_postings.top(terms, limit):
+                entry = user_index.recipes[recipe_id]
+                recipes.append({
+                    "recipe_id": recipe_id,
+                    "name": entry.name,
+                    "english_name": entry.english_name,
+                    "image_path": entry.image_path,
+                    "matched": sorted(entry.terms & terms),
+                    "score": round(score / len(terms), 3),
+                    "coverage": round(score / len(entry.terms), 3),
+                    "history_ids": sorted(entry.history_ids, reverse=True),
+                    "favorite_ids": sorted(entry.favorite_ids, reverse=True),
+                })
+            histories = [
+                {
+                    "history_id": history_id,
+                    "matched": sorted(user_index.history_postings.terms[history_id] & terms),
+                    "score": round(score / len(terms), 3),
+                }
+                for score, history_id in user_index.history_postings.top(terms, limit)
+            ]
+        return {"ingredients": sorted(terms), "recipes": recipes, "histories": histories}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "recipes": sum(len(u.recipes) for u in self._users.values()),
+                "histories": sum(len(u.histories) for u in self._users.values()),
+            }
+
+
+class RecipeCatalog:
+    """Generated recipes by ingredient, across all users, for reusing past answers.
+
+    Only recipes linked to a history (so produced by the model, not posted
+    by a client as a favorite) are included, since a hit serves them to
+    other users. Loaded from the database on first use and extended by
+    crud as histories are saved. Histories saved by other workers are
+    picked up before each lookup: one MAX(history_id) on the
+    history_recipes primary key tells whether any were added, and only
+    their recipes are read. Rebuilt fully after RECIPE_INDEX_TTL.
+    """
+    def __init__(self, ttl: float = RECIPE_INDEX_TTL):
+        self.ttl = ttl
+        self._postings = None
+        self._last_history_id = 0  # newest history whose recipes are loaded
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self, db: Session):
+        latest = db.query(func.max(models.HistoryRecipe.history_id)).scalar() or 0
+        with self._lock:
+            if self._postings is None or time.monotonic() - self._loaded_at > self.ttl:
+                postings, after = _Postings(), None
+            elif latest > self._last_history_id:
+                postings, after = self._postings, self._last_history_id
+            else:
+                return
+            generated = select(models.HistoryRecipe.recipe_id)
+            if after is not None:
+                generated = generated.where(models.HistoryRecipe.history_id > after)
+            terms = {}
+            rows = (
+                db.query(models.RecipeIngredient.recipe_id, models.Ingredient.name)
+                .join(models.Ingredient, models.Ingredient.id == models.RecipeIngredient.ingredient_id)
+                .filter(models.RecipeIngredient.recipe_id.in_(generated))
+                .order_by(models.RecipeIngredient.recipe_id)
+            )
+            for recipe_id, name in rows:
+                terms.setdefault(recipe_id, set()).add(name)
+            for recipe_id, names in terms.items():
+                if recipe_id not in postings:
+                    postings.add(recipe_id, frozenset(names))
+            if postings is not self._postings:
+                self._postings = postings
+                self._loaded_at = time.monotonic()
+            self._last_history_id = latest
+
+    def add(self, entry: IndexedRecipe):
+        with self._lock:
+            # Before the first load the recipe is picked up from the database
+            if self._postings is not None and entry.recipe_id not in self._postings and entry.terms:
+                self._postings.add(entry.recipe_id, entry.terms)
+
+    def best_covered(self, db: Session, available: set, pantry: set, min_coverage: float,
+                     limit: int, candidates: int = 200) -> list[tuple]:
+        """(coverage, jaccard, recipe_id) for recipes that can mostly be made from what is available.
+
+        Candidates are the recipes sharing the most non-pantry ingredients
+        with available; coverage is the share of a recipe's ingredients that
+        are either available or pantry staples.
+        """
+        self._ensure_loaded(db)
+        have = available | pantry
+        with self._lock:
+            matches = []
+            for _, recipe_id in self._postings.top(available - pantry, candidates):
+                terms = self._postings.terms[recipe_id]
+                shared = len(terms & have)
+                matches.append((round(shared / len(terms), 3), round(shared / len(terms | have), 3), recipe_id))
+        matches = [m for m in matches if m[0] >= min_coverage]
+        matches.sort(reverse=True)
+        return matches[:limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"loaded": self._postings is not None, "recipes": len(self._postings.terms) if self._postings else 0}
+
+
+index = RecipeIndex()
+catalog = RecipeCatalog()
+metrics.Gauge("recipe_index_users", "Users whose recipes are indexed in this process", callback=lambda: index.stats()["users"])
+metrics.Gauge("recipe_index_recipes", "Recipes in the per-user search index", callback=lambda: index.stats()["recipes"])
+metrics.Gauge("recipe_catalog_recipes", "Recipes in the reuse catalog", callback=lambda: catalog.stats()["recipes"])
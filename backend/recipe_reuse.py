@@ -0,0 +1,93 @@
+"""Answer /analyze from recipes we already generated when the fridge looks familiar.
+
+Reuse mode first gets the ingredient list, either from the user or from a
+detection-only Gemini call that is much cheaper than a full analysis. It
+then looks for stored recipes whose ingredients are covered by that list
+plus common pantry staples. Only when too few recipes qualify does the
+request fall through to full generation.
+
+Stored recipes cannot honour a prompt ("5 vegan desserts"), so requests
+with a non-empty prompt always skip reuse and are generated.
+"""
+import os
+import asyncio
+from typing import Optional
+
+import ai_agent
+import crud
+import database
+import food_images
+import metrics
+import rate_limiter
+import recipe_index
+import tracing
+
+# Share of a recipe's ingredients that must be in the fridge (or pantry)
+REUSE_MIN_COVERAGE = float(os.getenv("REUSE_MIN_COVERAGE", 0.8))
+# Recipes returned on a hit, and how many must qualify to count as one
+REUSE_RECIPES = int(os.getenv("REUSE_RECIPES", 3))
+REUSE_MIN_RECIPES = int(os.getenv("REUSE_MIN_RECIPES", 2))
+# Seasonings that recipes list but photos rarely show
+REUSE_PANTRY = recipe_index.ingredient_terms(
+    os.getenv("REUSE_PANTRY", "소금,설탕,후추,간장,식용유,참기름,물,깨,다진 마늘,고춧가루,식초").split(",")
+)
+
+LOOKUPS = metrics.Counter("recipe_reuse_lookups_total", "Reuse-mode lookups by outcome", ["outcome"])
+
+def find_reusable(detected: list[str]) -> Optional[dict]:
+    available = recipe_index.ingredient_terms(detected)
+    if not available:
+        return None
+    db = database.SessionLocal()
+    try:
+        matches = recipe_index.catalog.best_covered(
+            db, set(available), set(REUSE_PANTRY), REUSE_MIN_COVERAGE, limit=REUSE_RECIPES * 3
+        )
+        recipes = []
+        names = set()
+        for recipe in crud.get_recipes(db, [recipe_id for _, _, recipe_id in matches]):
+            # Regenerated variants of the same dish are stored separately; show one
+            if recipe.name in names:
+                continue
+            names.add(recipe.name)
+            recipes.append(recipe.to_dict())
+            if len(recipes) == REUSE_RECIPES:
+                break
+    finally:
+        db.close()
+
+    if len(recipes) < REUSE_MIN_RECIPES:
+        return None
+    missing_images = [r for r in recipes if not r.get("image_path")]
+    if missing_images:
+        food_images.schedule_recipe_images(missing_images)
+    return {"detected_ingredients": list(detected), "recipes": recipes, "reused": True}
+
+async def try_reuse(image_paths: list[str], ingredients: list[str] = None, user_prompt: str = "") -> Optional[dict]:
+    """A full analysis result built from stored recipes, or None on a miss."""
+    if user_prompt.strip():
+        LOOKUPS.inc(outcome="prompt")
+        return None
+    detected = ingredients
+    if not detected:
+        try:
+            detected = await ai_agent.detect_ingredients_async(image_paths)
+        except rate_limiter.LimiterBusy:
+            raise
+        except Exception as e:
+            print(f"[AI Chef] Ingredient detection failed, generating instead: {e}")
+            LOOKUPS.inc(outcome="error")
+            return None
+
+    with tracing.span("reuse_lookup"):
+        result = await asyncio.to_thread(find_reusable, detected)
+    LOOKUPS.inc(outcome="hit" if result else "miss")
+    if result:
+        print(f"[AI Chef] Reused {len(result['recipes'])} stored recipes for {len(detected)} ingredients")
+    return result
+
+async def analyze_with_reuse(image_paths: list[str], user_prompt: str = "", ingredients: list[str] = None) -> dict:
+    result = await try_reuse(image_paths, ingredients, user_prompt)
+    if result is not None:
+        return result
+    return await ai_agent.analyze_fridge_image_async(image_paths, user_prompt)
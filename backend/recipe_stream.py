@@ -0,0 +1,67 @@
+import json
+
+
+class RecipeStreamParser:
+    """Incrementally scans the model's JSON output as it streams in.
+
+    The expected document is {"detected_ingredients": [...], "recipes": [{...}, ...]}.
+    feed() returns ("detected_ingredients", list) once that array has closed
+    and ("recipe", dict) for every recipe object as soon as its closing brace
+    arrives, without waiting for the rest of the document. Anything outside
+    the top-level object (such as a stray ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False
+        self.string_start = None
+        self.key = None
+        self.value_start = None
+        self.item_start = None
+
+    def feed(self, text: str) -> list[tuple]:
+        events = []
+        self.buf += text
+        while self.pos < len(self.buf):
+            ch = self.buf[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.expect_key:
+                        self.key = json.loads(self.buf[self.string_start:self.pos + 1])
+            elif ch == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif ch in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect_key = True
+                elif self.depth == 2:
+                    self.value_start = self.pos
+                elif self.depth == 3 and self.key == "recipes" and ch == "{":
+                    self.item_start = self.pos
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 1 and self.key == "detected_ingredients":
+                    events.append(("detected_ingredients", json.loads(self.buf[self.value_start:self.pos + 1])))
+                elif self.depth == 2 and self.key == "recipes" and self.item_start is not None:
+                    events.append(("recipe", json.loads(self.buf[self.item_start:self.pos + 1])))
+                    self.item_start = None
+            elif self.depth == 1 and ch == ":":
+                self.expect_key = False
+            elif self.depth == 1 and ch == ",":
+                self.expect_key = True
+            self.pos += 1
+        return events
+
+    @property
+    def text(self) -> str:
+        return self.buf
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator, model_validator
 from typing import Optional, List, Any
+import storage
 
 class UserBase(BaseModel):
     username: str
@@ -28,6 +29,12 @@ class User(UserBase):
     kling_ai_secret_key: Optional[str] = None
     deapi_api_key: Optional[str] = None
 
+    @field_validator("profile_image")
+    @classmethod
+    def resolve_profile_image(cls, value):
+        # The database holds the stored key; the URL depends on the store
+        return storage.url_for(value)
+
     class Config:
         from_attributes = True
 
@@ -41,17 +48,42 @@ class TokenData(BaseModel):
 class HistoryBase(BaseModel):
     prompt_text: Optional[str] = None
     input_image_path: Optional[str] = None
+    input_images: Optional[List[Any]] = None
     analysis_result: Optional[Any] = None
 
 class HistoryCreate(HistoryBase):
     pass
 
-class History(HistoryBase):
+class BatchAnalyzeItem(BaseModel):
+    # files are indexes into the request's uploads; history_id re-runs a saved history's photos
+    prompt: Optional[str] = None
+    files: List[int] = []
+    history_id: Optional[int] = None
+
+class InputImageUrls(BaseModel):
+    @model_validator(mode="after")
+    def resolve_input_images(self):
+        # Rows from before structured references only have input_image_path
+        refs = self.input_images if self.input_images is not None else storage.legacy_refs(self.input_image_path)
+        self.input_images = storage.with_urls(refs)
+        return self
+
+class History(HistoryBase, InputImageUrls):
     id: int
     user_id: int
     class Config:
         from_attributes = True
 
+class HistorySummary(InputImageUrls):
+    id: int
+    prompt_text: Optional[str] = None
+    input_image_path: Optional[str] = None
+    input_images: Optional[List[Any]] = None
+    summary: Optional[Any] = None
+    created_at: Optional[Any] = None
+    class Config:
+        from_attributes = True
+
 class FavoriteCreate(BaseModel):
     recipe_data: Any
 
@@ -61,3 +93,32 @@ class Favorite(BaseModel):
     recipe_data: Any
     class Config:
         from_attributes = True
+
+class FavoriteSummary(BaseModel):
+    id: int
+    recipe_name: Optional[str] = None
+    summary: Optional[Any] = None
+    created_at: Optional[Any] = None
+    class Config:
+        from_attributes = True
+
+class RecipeMatch(BaseModel):
+    recipe_id: int
+    name: Optional[str] = None
+    english_name: Optional[str] = None
+    image_path: Optional[str] = None
+    matched: List[str]
+    score: float
+    coverage: float
+    history_ids: List[int]
+    favorite_ids: List[int]
+
+class HistoryMatch(BaseModel):
+    history_id: int
+    matched: List[str]
+    score: float
+
+class RecipeSearchResult(BaseModel):
+    ingredients: List[str]
+    recipes: List[RecipeMatch]
+    histories: List[HistoryMatch]
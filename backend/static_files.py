@@ -0,0 +1,71 @@
+"""Serving uploads with strong ETags and long-lived cache headers.
+
+Uploads are stored under their sha256, so their URLs always name the
+same bytes and browsers may cache them forever. Recipe food images
+(foodImgs/dish-*) are named after the dish instead; the image cache may
+drop an unreferenced one and fetch it again later, so those (and their
+thumbnails) are revalidated against the ETag rather than cached blindly.
+"""
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+import storage
+
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+_HASH_CACHE_SIZE = 10000
+
+_hashes = OrderedDict()  # path -> (mtime_ns, size, sha256)
+_hashes_lock = threading.Lock()
+
+
+def content_hash(path: str, stat_result: os.stat_result) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if _SHA256_NAME.match(stem):
+        parts = os.path.normpath(path).split(os.sep)
+        if ".thumbs" in parts[:-2]:
+            # A thumbnail is named after its original; each size is different bytes
+            return f"{stem}-{parts[parts.index('.thumbs') + 1]}"
+        # Content-addressed upload: the name already is the hash
+        return stem
+    key = (stat_result.st_mtime_ns, stat_result.st_size)
+    with _hashes_lock:
+        cached = _hashes.get(path)
+        if cached is not None and cached[:2] == key:
+            _hashes.move_to_end(path)
+            return cached[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _hashes_lock:
+        _hashes[path] = (*key, digest)
+        while len(_hashes) > _HASH_CACHE_SIZE:
+            _hashes.popitem(last=False)
+    return digest
+
+
+def cached_file_response(path: str, request_headers: Headers, stat_result: os.stat_result = None) -> Response:
+    """FileResponse with a content-hash ETag and long-lived caching; 304 when the client has it."""
+    stat_result = stat_result or os.stat(path)
+    etag = f'"{content_hash(path, stat_result)}"'
+    headers = {"ETag": etag, "Cache-Control": storage.cache_control(path)}
+    if_none_match = request_headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return NotModifiedResponse(Headers(headers))
+    return FileResponse(path, stat_result=stat_result, headers=headers)
+
+
+class CachedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        if status_code != 200:
+            # html-mode 404 pages are not content-addressed
+            return super().file_response(full_path, stat_result, scope, status_code)
+        return cached_file_response(str(full_path), Headers(scope=scope), stat_result)
@@ -0,0 +1,209 @@
+"""Where uploaded and generated images live.
+
+Files are addressed by key, e.g. "uploads/<sha256>.jpg" or
+"uploads/foodImgs/dish-<hash of the dish name>.jpg". The key is what gets stored in the
+database, wrapped in a small reference ({"store": ..., "key": ...}), and
+turned into a URL only when a response is built. That keeps rows valid
+when the public URL or the backend changes.
+
+STORAGE_BACKEND=local keeps files under backend/ as before and serves
+them through /uploads. STORAGE_BACKEND=s3 puts them in an S3-compatible
+bucket (AWS S3, MinIO, ...) so several backend nodes can share them.
+Each node also keeps a local copy of what it touched, since PIL and the
+Gemini upload need files on disk.
+
+Trying it against MinIO:
+    docker run -p 9000:9000 minio/minio server /data
+    STORAGE_BACKEND=s3 S3_BUCKET=aichef S3_ENDPOINT_URL=http://localhost:9000 \
+    AWS_ACCESS_KEY_ID=minioadmin AWS_SECRET_ACCESS_KEY=minioadmin uvicorn main:app
+"""
+import os
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Directory that holds uploads/ for the local store (and this node's caches)
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", BASE_DIR)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+# Base for URLs handed to the browser; set to the load balancer's address
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+# Public base of the bucket; defaults to path-style <endpoint>/<bucket>
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", "").rstrip("/")
+# Node-local copies of objects for image processing
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", os.path.join(STORAGE_ROOT, "uploads", ".cache"))
+
+# Content-addressed keys never change content, so objects can be cached forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Dish images are named after the dish, not the bytes: one that was evicted
+# and fetched again holds a different photo under the same key
+REVALIDATE = "public, no-cache"
+
+
+def cache_control(key: str) -> str:
+    """Cache-Control for a key or a file derived from it (thumbnails keep the name)."""
+    return REVALIDATE if os.path.basename(key).startswith("dish-") else IMMUTABLE
+
+
+def _check_key(key: str) -> str:
+    parts = key.replace("\\", "/").split("/")
+    if key.startswith("/") or ".." in parts or not key:
+        raise ValueError(f"Invalid storage key: {key!r}")
+    return key
+
+
+class LocalStore:
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_ROOT, base_url: str = PUBLIC_BASE_URL):
+        self.root = root
+        self.base_url = base_url
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, _check_key(key))
+
+    def put_file(self, key: str, src: str, content_type: str = None) -> str:
+        """Move src into the store under key and return a local path to it."""
+        dest = self.path(key)
+        if os.path.abspath(src) != os.path.abspath(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(src, dest)
+        return dest
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def size(self, key: str) -> int:
+        """Size in bytes. Raises FileNotFoundError."""
+        return os.path.getsize(self.path(key))
+
+    def local_path(self, key: str) -> str:
+        return self.path(key)
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{_check_key(key)}"
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store:
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: str = S3_ENDPOINT_URL, region: str = S3_REGION,
+                 public_url: str = S3_PUBLIC_URL, cache_dir: str = STORAGE_CACHE_DIR):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client_error = ClientError
+        if public_url:
+            self.public_url = public_url
+        elif endpoint_url:
+            self.public_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_url = f"https://{bucket}.s3.amazonaws.com"
+        self.cache_dir = cache_dir
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, _check_key(key))
+
+    def put_file(self, key: str, src: str, content_type: str = None) -> str:
+        extra = {"CacheControl": cache_control(key)}
+        if content_type:
+            extra["ContentType"] = content_type
+        self.client.upload_file(src, self.bucket, _check_key(key), ExtraArgs=extra)
+        cached = self._cache_path(key)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        os.replace(src, cached)
+        return cached
+
+    def exists(self, key: str) -> bool:
+        if os.path.exists(self._cache_path(key)):
+            return True
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=_check_key(key))
+            return True
+        except self.client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def size(self, key: str) -> int:
+        """Size in bytes, from the local copy or a HEAD request; never downloads. Raises FileNotFoundError."""
+        try:
+            return os.path.getsize(self._cache_path(key))
+        except FileNotFoundError:
+            pass
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=_check_key(key))["ContentLength"]
+        except self.client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key)
+            raise
+
+    def local_path(self, key: str) -> str:
+        """A local copy of the object, downloaded on first use. Raises FileNotFoundError."""
+        cached = self._cache_path(key)
+        if not os.path.exists(cached):
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            tmp = f"{cached}.{uuid.uuid4().hex}.part"
+            try:
+                self.client.download_file(self.bucket, _check_key(key), tmp)
+            except self.client_error:
+                raise FileNotFoundError(key)
+            os.replace(tmp, cached)
+        return cached
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{_check_key(key)}"
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=_check_key(key))
+        try:
+            os.remove(self._cache_path(key))
+        except FileNotFoundError:
+            pass
+
+
+def build_store(backend: str = STORAGE_BACKEND):
+    if backend == "s3":
+        return S3Store()
+    return LocalStore()
+
+
+store = build_store()
+
+
+def ref(key: str) -> dict:
+    """The structured reference saved in the database for a stored file."""
+    return {"store": store.name, "key": key}
+
+
+def legacy_refs(paths: str) -> list[dict]:
+    """References for an old comma-joined input_image_path."""
+    keys = [p.strip().replace("backend/", "", 1) for p in (paths or "").split(",") if p.strip()]
+    return [{"store": "local", "key": key} for key in keys]
+
+
+def url_for(value: str) -> str:
+    """Browser URL for a stored key; full URLs saved before keys were stored pass through."""
+    if not value or "://" in value:
+        return value
+    return store.url(value)
+
+
+def with_urls(refs: list) -> list[dict]:
+    """refs with a "url" for the browser; the URL is never stored."""
+    return [{**r, "url": store.url(r["key"])} for r in refs or [] if isinstance(r, dict) and r.get("key")]
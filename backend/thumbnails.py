@@ -0,0 +1,98 @@
+"""Fixed-size preview images for files under uploads/.
+
+Thumbnails are written to this node's uploads/.thumbs/<size>/ and are
+created either right after an upload (schedule) or on the first request
+for them (ensure_thumbnail), fetching the original from storage if this
+node has not seen it. Originals are never rewritten in place, so a
+thumbnail on disk stays valid forever.
+"""
+import os
+import threading
+
+import image_preprocess
+import storage
+from uploads import UPLOAD_DIR
+
+# Longest edge in pixels; only these sizes are served
+THUMBNAIL_SIZES = tuple(int(s) for s in os.getenv("THUMBNAIL_SIZES", "160,320,640").split(",") if s.strip())
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", 80))
+THUMB_DIR = os.path.join(UPLOAD_DIR, ".thumbs")
+
+# One generation per source at a time; concurrent requests wait for it
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def source_path(key: str) -> str:
+    """Local path of an original, e.g. "uploads/abc.jpg". Raises ValueError outside uploads/."""
+    inner = key[len("uploads/"):] if key.startswith("uploads/") else None
+    if not inner or inner.startswith((".thumbs", ".tmp", ".cache")):
+        raise ValueError("Not an uploaded file")
+    return storage.store.local_path(key)
+
+
+def thumbnail_path(key: str, size: int) -> str:
+    return os.path.join(THUMB_DIR, str(size), os.path.splitext(key[len("uploads/"):])[0] + ".jpg")
+
+
+def _write(img, size: int, dest: str):
+    import PIL.Image
+
+    thumb = img.copy()
+    thumb.thumbnail((size, size), PIL.Image.LANCZOS)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{threading.get_ident()}.part"
+    thumb.save(tmp, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    os.replace(tmp, dest)
+
+
+def generate(key: str, source: str, sizes=THUMBNAIL_SIZES):
+    """Write every missing size for key, decoding the original at source once."""
+    missing = [(size, thumbnail_path(key, size)) for size in sizes]
+    missing = [(size, dest) for size, dest in missing if not os.path.exists(dest)]
+    if not missing:
+        return
+    import PIL.Image
+    import PIL.ImageOps
+
+    with _locks_guard:
+        lock = _locks.setdefault(source, threading.Lock())
+    try:
+        with lock:
+            missing = [(size, dest) for size, dest in missing if not os.path.exists(dest)]
+            if not missing:
+                return
+            with PIL.Image.open(source) as img:
+                # Decode at reduced scale when the format allows it (JPEG draft mode)
+                img.draft("RGB", (max(size for size, _ in missing),) * 2)
+                img = PIL.ImageOps.exif_transpose(img)
+                if img.mode != "RGB":
+                    img = img.convert("RGB")
+                for size, dest in missing:
+                    _write(img, size, dest)
+    finally:
+        with _locks_guard:
+            _locks.pop(source, None)
+
+
+def ensure_thumbnail(key: str, size: int) -> str:
+    """Path of the thumbnail, generating it if needed. Raises ValueError / FileNotFoundError."""
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f"Unsupported thumbnail size {size}")
+    source = source_path(key)
+    dest = thumbnail_path(key, size)
+    if not os.path.exists(dest):
+        if not os.path.isfile(source):
+            raise FileNotFoundError(key)
+        generate(key, source, [size])
+    return dest
+
+
+def schedule(key: str, source: str):
+    """Pre-generate all sizes on the image decode pool right after an upload."""
+    def run():
+        try:
+            generate(key, source)
+        except Exception as e:
+            print(f"[AI Chef] Thumbnail generation failed for {key}: {e}")
+    image_preprocess._executor.submit(run)
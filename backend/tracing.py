@@ -0,0 +1,94 @@
+"""Stage timings for the analyze pipeline.
+
+span(stage) times one step (upload, preprocess, gemini, parse, ...) into
+the analyze_stage_seconds histogram. Inside a trace(name) block the step
+is also added to that request's breakdown, which is logged when the whole
+request takes longer than SLOW_REQUEST_SECONDS.
+
+The current trace is kept in a contextvar, so it follows awaits and
+asyncio.to_thread but not work handed to an executor directly; time such
+work around the await instead.
+"""
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+import metrics
+
+# 0 turns the slow-request log off
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 0))
+
+STAGE_SECONDS = metrics.Histogram("analyze_stage_seconds", "Time spent in each analyze stage", ["stage"])
+STAGE_FAILURES = metrics.Counter("analyze_stage_failures_total", "Analyze stages that raised", ["stage"])
+REQUEST_SECONDS = metrics.Histogram("analyze_request_seconds", "End-to-end analyze time", ["endpoint", "outcome"])
+SLOW_REQUESTS = metrics.Counter("analyze_slow_requests_total", "Analyze requests slower than SLOW_REQUEST_SECONDS", ["endpoint"])
+
+_current = contextvars.ContextVar("analyze_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []  # (stage, seconds) in completion order
+
+    def add(self, stage: str, seconds: float):
+        self.spans.append((stage, seconds))
+
+    def breakdown(self) -> dict:
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def finish(self, outcome: str = "ok"):
+        total = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(total, endpoint=self.name, outcome=outcome)
+        if SLOW_REQUEST_SECONDS and total >= SLOW_REQUEST_SECONDS:
+            SLOW_REQUESTS.inc(endpoint=self.name)
+            stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.breakdown().items())
+            print(f"[AI Chef] Slow {self.name} ({outcome}): {total:.2f}s [{stages or 'no stages'}]")
+
+
+def record(stage: str, seconds: float):
+    """Record a duration measured elsewhere, e.g. a limiter wait."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_FAILURES.inc(stage=stage)
+        raise
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def activate(trace: Trace):
+    """Make trace current, e.g. again inside a streamed response body."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def trace(name: str):
+    """Time one request end to end; spans inside it form its breakdown."""
+    current = Trace(name)
+    outcome = "error"
+    with activate(current):
+        try:
+            yield current
+            outcome = "ok"
+        finally:
+            current.finish(outcome)
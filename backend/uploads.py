@@ -0,0 +1,125 @@
+import os
+import uuid
+import asyncio
+import hashlib
+from dataclasses import dataclass
+
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+
+import storage
+
+# Use absolute path for uploads directory
+BASE_DIR = storage.STORAGE_ROOT
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")
+# The /uploads static mount needs the directory, also on a fresh STORAGE_ROOT
+os.makedirs(TMP_DIR, exist_ok=True)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", 15 * 1024 * 1024))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", 40 * 1024 * 1024))
+
+
+@dataclass
+class StoredUpload:
+    path: str           # local path to the file, for image processing
+    relative_path: str  # storage key, e.g. uploads/<sha256>.jpg
+    sha256: str
+    size: int
+    deduplicated: bool
+
+
+class UploadBudget:
+    """Tracks the bytes left for the whole request across all of its files."""
+
+    def __init__(self, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.remaining = max_bytes
+
+    def consume(self, n: int):
+        self.remaining -= n
+        if self.remaining < 0:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Upload exceeds the {UPLOAD_MAX_REQUEST_BYTES} byte request limit",
+            )
+
+
+CONTENT_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+
+
+def sniff_image_type(head: bytes):
+    """Return the file extension for a supported image header, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    return None
+
+
+async def ingest_upload(file: UploadFile, budget: UploadBudget = None) -> StoredUpload:
+    """Stream an uploaded image to content-addressed storage.
+
+    The header is checked on the first chunk, the SHA-256 is computed while
+    writing and the size limits are enforced chunk by chunk, so bad or
+    oversized files are rejected without being written out in full.
+    Identical uploads resolve to the same stored file.
+    """
+    if file.size is not None and file.size > UPLOAD_MAX_FILE_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"{file.filename} exceeds the {UPLOAD_MAX_FILE_BYTES} byte file limit",
+        )
+
+    first = await file.read(UPLOAD_CHUNK_SIZE)
+    extension = sniff_image_type(first[:16])
+    if extension is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"{file.filename} is not a supported image (jpg, png, webp, gif)",
+        )
+
+    os.makedirs(TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(TMP_DIR, f"{uuid.uuid4()}.part")
+    digest = hashlib.sha256()
+    size = 0
+    chunk = first
+    try:
+        async with aiofiles.open(tmp_path, "wb") as buffer:
+            while chunk:
+                size += len(chunk)
+                if size > UPLOAD_MAX_FILE_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"{file.filename} exceeds the {UPLOAD_MAX_FILE_BYTES} byte file limit",
+                    )
+                if budget is not None:
+                    budget.consume(len(chunk))
+                digest.update(chunk)
+                await buffer.write(chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    key = f"uploads/{sha256}.{extension}"
+    # Store calls may go over the network (S3), so keep them off the event loop
+    deduplicated = await asyncio.to_thread(storage.store.exists, key)
+    if deduplicated:
+        os.remove(tmp_path)
+        file_path = await asyncio.to_thread(storage.store.local_path, key)
+    else:
+        file_path = await asyncio.to_thread(storage.store.put_file, key, tmp_path, CONTENT_TYPES[extension])
+
+    return StoredUpload(
+        path=file_path,
+        relative_path=key,
+        sha256=sha256,
+        size=size,
+        deduplicated=deduplicated,
+    )
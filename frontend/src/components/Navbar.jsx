@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { User, LogOut, History, Heart, Settings, ChefHat } from 'lucide-react';
 import api from '../utils/api';
+import { thumbnailUrl, THUMB_SMALL } from '../utils/images';
 
 const Navbar = () => {
     const [showMenu, setShowMenu] = useState(false);
@@ -50,7 +51,7 @@ const Navbar = () => {
             <div className="profile-menu" ref={menuRef}>
                 <div className="profile-icon" onClick={() => setShowMenu(!showMenu)}>
                     {user && user.profile_image ? (
-                        <img src={user.profile_image} alt="Profile" />
+                        <img src={thumbnailUrl(user.profile_image, THUMB_SMALL)} alt="Profile" />
                     ) : (
                         <User size={20} />
                     )}
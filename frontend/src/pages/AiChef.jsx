@@ -1,6 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Upload, Heart, Download, X, Maximize2, Paperclip, Mic, Loader2 } from 'lucide-react';
-import api from '../utils/api';
+import api, { API_BASE } from '../utils/api';
+import { imageUrl } from '../utils/images';
 import jsPDF from 'jspdf';
 import html2canvas from 'html2canvas';
 
@@ -111,8 +112,44 @@ const AiChef = () => {
         formData.append('prompt', prompt);
 
         try {
-            const res = await api.post('/analyze', formData);
-            setResult(res.data);
+            // Stream the analysis so each recipe renders as soon as the model finishes it
+            const res = await fetch(`${api.defaults.baseURL}/analyze/stream`, {
+                method: 'POST',
+                headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
+                body: formData,
+            });
+            if (res.status === 401) {
+                localStorage.removeItem('token');
+                window.location.href = '/login';
+                return;
+            }
+            if (!res.ok) throw new Error(`HTTP ${res.status}`);
+
+            setResult({ detected_ingredients: [], recipes: [] });
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    setLoading(false);
+                    if (event.type === 'detected_ingredients') {
+                        setResult(prev => ({ ...prev, detected_ingredients: event.data }));
+                    } else if (event.type === 'recipe') {
+                        setResult(prev => ({ ...prev, recipes: [...prev.recipes, event.data] }));
+                    } else if (event.type === 'done') {
+                        setResult(event.data);
+                    } else if (event.type === 'error') {
+                        setResult({ error: event.data });
+                    }
+                }
+            }
         } catch (error) {
             alert('Analysis failed');
         } finally {
@@ -139,6 +176,16 @@ const AiChef = () => {
     const ImageWithLoader = ({ src, alt, ...props }) => {
         const [loaded, setLoaded] = useState(false);
         const [error, setError] = useState(false);
+        const [attempt, setAttempt] = useState(0);
+
+        // Recipe images may still be downloading on the server, so retry a few times before giving up
+        const handleError = () => {
+            if (attempt < 5) {
+                setTimeout(() => setAttempt(prev => prev + 1), 1000);
+            } else {
+                setError(true);
+            }
+        };
 
         return (
             <div style={{ width: '100%', height: '100%', position: 'relative', backgroundColor: '#333' }}>
@@ -155,12 +202,12 @@ const AiChef = () => {
                     </div>
                 )}
                 <img
-                    src={src}
+                    src={attempt > 0 && src.startsWith(`${API_BASE}/`) ? `${src}?retry=${attempt}` : src}
                     alt={alt}
                     {...props}
                     style={{ ...props.style, opacity: loaded ? 1 : 0, transition: 'opacity 0.5s' }}
                     onLoad={() => setLoaded(true)}
-                    onError={() => setError(true)}
+                    onError={handleError}
                 />
             </div>
         );
@@ -347,7 +394,7 @@ const AiChef = () => {
                                     {/* Recipe Image Display */}
                                     <div style={{ width: '100%', height: 250, overflow: 'hidden', borderRadius: '8px 8px 0 0', marginBottom: 15, backgroundColor: '#333' }}>
                                         <ImageWithLoader
-                                            src={recipe.image_path ? `http://localhost:8000/${recipe.image_path}` : `https://tse2.mm.bing.net/th?q=${encodeURIComponent((recipe.english_name || recipe.name) + " delicious food photorealistic")}&w=800&h=500&c=7&rs=1&p=0`}
+                                            src={recipe.image_path ? imageUrl(recipe.image_path) : `https://tse2.mm.bing.net/th?q=${encodeURIComponent((recipe.english_name || recipe.name) + " delicious food photorealistic")}&w=800&h=500&c=7&rs=1&p=0`}
                                             alt={recipe.name}
                                             style={{ width: '100%', height: '100%', objectFit: 'cover' }}
                                             crossOrigin="anonymous"
@@ -1,5 +1,6 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import api from '../utils/api';
+import { imageUrl, thumbnailUrl, THUMB_LARGE } from '../utils/images';
 import { Clock, Users, ChevronRight, X, Trash2, Download } from 'lucide-react';
 import html2canvas from 'html2canvas';
 import jsPDF from 'jspdf';
@@ -10,6 +11,7 @@ const Favorites = () => {
     const [page, setPage] = useState(0);
     const [loading, setLoading] = useState(false);
     const [hasMore, setHasMore] = useState(true);
+    const cursorRef = useRef(null);
 
     useEffect(() => {
         fetchFavorites(page);
@@ -34,10 +36,12 @@ const Favorites = () => {
         setLoading(true);
         try {
             const limit = 12;
-            const skip = pageNum * limit;
-            const res = await api.get(`/favorites?skip=${skip}&limit=${limit}`);
+            const params = { limit };
+            if (pageNum > 0) params.cursor = cursorRef.current;
+            const res = await api.get('/favorites/summary', { params });
 
-            if (res.data.length < limit) {
+            cursorRef.current = res.headers['x-next-cursor'] || null;
+            if (!cursorRef.current) {
                 setHasMore(false);
             }
 
@@ -54,6 +58,16 @@ const Favorites = () => {
         setLoading(false);
     };
 
+    const openRecipe = async (id) => {
+        // The list only carries summaries; load the full recipe on demand
+        try {
+            const res = await api.get(`/favorites/id/${id}`);
+            setSelectedRecipe(res.data.recipe_data);
+        } catch (e) {
+            alert('Failed to load recipe');
+        }
+    };
+
     const handleDelete = async (id) => {
         if (!window.confirm("Remove this recipe from your cookbook?")) return;
         try {
@@ -107,12 +121,12 @@ const Favorites = () => {
                             <div
                                 key={fav.id}
                                 className="recipe-card-hover"
-                                onClick={() => setSelectedRecipe(fav.recipe_data)}
+                                onClick={() => openRecipe(fav.id)}
                             >
                                 <div style={{ height: 180, overflow: 'hidden', backgroundColor: '#333', position: 'relative' }}>
                                     <img
-                                        src={fav.recipe_data.image_path ? `http://localhost:8000/${fav.recipe_data.image_path}` : `https://image.pollinations.ai/prompt/${encodeURIComponent(fav.recipe_data.english_name || fav.recipe_data.name)} delicious food photorealistic?width=400&height=250&nologo=true`}
-                                        alt={fav.recipe_data.name}
+                                        src={fav.summary?.image_path ? thumbnailUrl(fav.summary.image_path, THUMB_LARGE) : `https://image.pollinations.ai/prompt/${encodeURIComponent(fav.summary?.english_name || fav.recipe_name)} delicious food photorealistic?width=400&height=250&nologo=true`}
+                                        alt={fav.recipe_name}
                                         style={{ width: '100%', height: '100%', objectFit: 'cover', transition: 'transform 0.3s' }}
                                         onError={(e) => { e.target.style.display = 'none' }}
                                     />
@@ -122,10 +136,10 @@ const Favorites = () => {
                                 </div>
 
                                 <div style={{ padding: 20, display: 'flex', flexDirection: 'column', height: 'calc(100% - 180px)' }}>
-                                    <h3 style={{ fontSize: '1.2rem', marginBottom: 10, whiteSpace: 'nowrap', overflow: 'hidden', textOverflow: 'ellipsis' }}>{fav.recipe_data.name}</h3>
+                                    <h3 style={{ fontSize: '1.2rem', marginBottom: 10, whiteSpace: 'nowrap', overflow: 'hidden', textOverflow: 'ellipsis' }}>{fav.recipe_name}</h3>
                                     <div style={{ flex: 1 }}>
                                         <p style={{ fontSize: '0.85rem', color: '#888', display: '-webkit-box', WebkitLineClamp: 3, WebkitBoxOrient: 'vertical', overflow: 'hidden' }}>
-                                            {fav.recipe_data.ingredients.join(', ')}
+                                            {(fav.summary?.ingredients || []).join(', ')}
                                         </p>
                                     </div>
                                     <div style={{ borderTop: '1px solid #3e3e42', paddingTop: 15, marginTop: 15, display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
@@ -186,7 +200,7 @@ const Favorites = () => {
 
                             <div className="modal-header-image">
                                 <img
-                                    src={selectedRecipe.image_path ? `http://localhost:8000/${selectedRecipe.image_path}` : `https://image.pollinations.ai/prompt/${encodeURIComponent(selectedRecipe.english_name || selectedRecipe.name)} delicious food photorealistic?width=800&height=400&nologo=true`}
+                                    src={selectedRecipe.image_path ? imageUrl(selectedRecipe.image_path) : `https://image.pollinations.ai/prompt/${encodeURIComponent(selectedRecipe.english_name || selectedRecipe.name)} delicious food photorealistic?width=800&height=400&nologo=true`}
                                     alt={selectedRecipe.name}
                                     style={{ width: '100%', height: '100%', objectFit: 'cover' }}
                                     crossOrigin="anonymous"
@@ -1,5 +1,6 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import api from '../utils/api';
+import { thumbnailUrl, THUMB_MEDIUM, THUMB_LARGE } from '../utils/images';
 import { Calendar, ChevronRight, X, Trash2, Download, Heart } from 'lucide-react';
 import html2canvas from 'html2canvas';
 import jsPDF from 'jspdf';
@@ -12,6 +13,7 @@ const MyHistory = () => {
     const [page, setPage] = useState(0);
     const [loading, setLoading] = useState(false);
     const [hasMore, setHasMore] = useState(true);
+    const cursorRef = useRef(null);
 
     useEffect(() => {
         fetchHistory(page);
@@ -40,9 +42,11 @@ const MyHistory = () => {
         setLoading(true);
         try {
             const limit = 5;
-            const skip = pageNum * limit;
-            const res = await api.get(`/history?skip=${skip}&limit=${limit}`);
-            if (res.data.length < limit) setHasMore(false);
+            const params = { limit };
+            if (pageNum > 0) params.cursor = cursorRef.current;
+            const res = await api.get('/history/summary', { params });
+            cursorRef.current = res.headers['x-next-cursor'] || null;
+            if (!cursorRef.current) setHasMore(false);
 
             setHistory(prev => {
                 if (pageNum === 0) return res.data;
@@ -54,11 +58,21 @@ const MyHistory = () => {
 
     const fetchFavorites = async () => {
         try {
-            const res = await api.get('/favorites?limit=1000');
-            setFavorites(new Set(res.data.map(f => f.recipe_data?.name || f.recipe_name)));
+            const res = await api.get('/favorites/summary?limit=1000');
+            setFavorites(new Set(res.data.map(f => f.recipe_name)));
         } catch (e) { }
     };
 
+    const openDetails = async (id) => {
+        // The list only carries summaries; load the full analysis on demand
+        try {
+            const res = await api.get(`/history/${id}`);
+            setSelectedItem(res.data);
+        } catch (e) {
+            alert('Failed to load details');
+        }
+    };
+
     const handleDelete = async (e, id) => {
         e.stopPropagation();
         if (!window.confirm("Delete this history item?")) return;
@@ -125,20 +139,20 @@ const MyHistory = () => {
                     <div style={{ display: 'grid', gap: 20 }}>
                         {history.map((h) => {
                             // Extract first image for preview
-                            const images = h.input_image_path ? h.input_image_path.split(',') : [];
+                            const images = (h.input_images || []).map((img) => img.key);
                             const firstImage = images.length > 0 ? images[0] : null;
 
                             return (
                                 <div
                                     key={h.id}
                                     className="history-card"
-                                    onClick={() => setSelectedItem(h)}
+                                    onClick={() => openDetails(h.id)}
                                     style={{ position: 'relative', display: 'flex', flexDirection: 'column' }}
                                 >
                                     <div className="history-image" style={{ width: '100%', height: 200, position: 'relative' }}>
                                         {firstImage ? (
                                             <img
-                                                src={`http://localhost:8000/${firstImage.replace('backend/', '')}`}
+                                                src={thumbnailUrl(firstImage, THUMB_MEDIUM)}
                                                 alt="Input"
                                                 style={{ width: '100%', height: '100%', objectFit: 'cover' }}
                                             />
@@ -161,9 +175,9 @@ const MyHistory = () => {
                                         </h3>
 
                                         <div style={{ display: 'flex', gap: 10, flexWrap: 'wrap', marginBottom: 15 }}>
-                                            {h.analysis_result && (h.analysis_result.recipes || h.analysis_result || []).slice(0, 3).map((r, i) => (
+                                            {(h.summary?.recipe_names || []).map((name, i) => (
                                                 <span key={i} style={{ background: '#252526', border: '1px solid #3e3e42', padding: '4px 10px', borderRadius: 6, fontSize: '0.85rem', color: '#ccc' }}>
-                                                    {r.name}
+                                                    {name}
                                                 </span>
                                             ))}
                                         </div>
@@ -179,7 +193,7 @@ const MyHistory = () => {
                                                 <Trash2 size={16} />
                                             </button>
                                             <button
-                                                onClick={() => setSelectedItem(h)}
+                                                onClick={() => openDetails(h.id)}
                                                 className="btn-secondary"
                                                 style={{ padding: '8px 16px', fontSize: '0.8rem', display: 'flex', alignItems: 'center', gap: 6, color: '#007acc', borderColor: '#007acc30' }}
                                             >
@@ -210,14 +224,14 @@ const MyHistory = () => {
                                         <div style={{ width: '100%' }}>
                                             <h4 style={{ color: '#888', marginBottom: 10 }}>Input Images</h4>
                                             <div style={{ display: 'flex', gap: 10, overflowX: 'auto', paddingBottom: 10 }}>
-                                                {selectedItem.input_image_path ? (
-                                                    selectedItem.input_image_path.split(',').map((path, idx) => (
+                                                {selectedItem.input_images?.length ? (
+                                                    selectedItem.input_images.map((img, idx) => (
                                                         <img
                                                             key={idx}
-                                                            src={`http://localhost:8000/${path.replace('backend/', '')}`}
+                                                            src={thumbnailUrl(img.key, THUMB_LARGE)}
                                                             alt={`Input ${idx + 1}`}
                                                             style={{ height: 200, width: 'auto', borderRadius: 8, border: '1px solid #444', flexShrink: 0, cursor: 'zoom-in' }}
-                                                            onClick={() => setPreviewImage(`http://localhost:8000/${path.replace('backend/', '')}`)}
+                                                            onClick={() => setPreviewImage(img.url)}
                                                             title="Click to enlarge"
                                                         />
                                                     ))
@@ -254,10 +268,15 @@ const MyHistory = () => {
                                                 {/* Recipe Image Display inside details */}
                                                 <div style={{ width: '100%', height: 200, overflow: 'hidden', borderRadius: '8px 8px 0 0', marginBottom: 15, backgroundColor: '#333' }}>
                                                     <img
-                                                        src={recipe.image_path ? `http://localhost:8000/${recipe.image_path}` : `https://tse2.mm.bing.net/th?q=${encodeURIComponent((recipe.english_name || recipe.name) + " delicious food photorealistic")}&w=800&h=500&c=7&rs=1&p=0`}
+                                                        src={recipe.image_path ? thumbnailUrl(recipe.image_path, THUMB_LARGE) : `https://tse2.mm.bing.net/th?q=${encodeURIComponent((recipe.english_name || recipe.name) + " delicious food photorealistic")}&w=800&h=500&c=7&rs=1&p=0`}
                                                         alt={recipe.name}
                                                         style={{ width: '100%', height: '100%', objectFit: 'cover' }}
                                                         crossOrigin="anonymous"
+                                                        onError={(e) => {
+                                                            // Cached dish images can be evicted; fall back to a live search
+                                                            const fallback = `https://tse2.mm.bing.net/th?q=${encodeURIComponent((recipe.english_name || recipe.name) + " delicious food photorealistic")}&w=800&h=500&c=7&rs=1&p=0`;
+                                                            if (e.target.src !== fallback) e.target.src = fallback;
+                                                        }}
                                                     />
                                                 </div>
 
@@ -1,7 +1,10 @@
 import axios from 'axios';
 
+// Point at the load balancer when running more than one backend node
+export const API_BASE = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
+
 const api = axios.create({
-    baseURL: 'http://localhost:8000',
+    baseURL: API_BASE,
 });
 
 api.interceptors.request.use((config) => {
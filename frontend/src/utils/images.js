@@ -0,0 +1,18 @@
+import { API_BASE } from './api';
+
+// Fixed preview sizes served by the backend (longest edge in px)
+export const THUMB_SMALL = 160;
+export const THUMB_MEDIUM = 320;
+export const THUMB_LARGE = 640;
+
+// Accepts a stored relative path ("uploads/abc.jpg", older rows may start with
+// "backend/") or a full backend URL as saved for profile images.
+const toRelative = (path) => path.replace(`${API_BASE}/`, '').replace('backend/', '');
+
+export const imageUrl = (path) => `${API_BASE}/${toRelative(path)}`;
+
+export const thumbnailUrl = (path, size = THUMB_MEDIUM) => {
+    if (!path) return path;
+    if (/^https?:\/\//.test(path) && !path.startsWith(API_BASE)) return path;
+    return `${API_BASE}/thumbs/${size}/${toRelative(path)}`;
+};